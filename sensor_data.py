@@ -1,25 +1,36 @@
 from __future__ import annotations
 
+import codecs
+import collections
+import contextlib
 import csv
 import datetime
 import functools
+import itertools
+import json
 import os
 import sqlite3
+import sys
 import threading
 import gzip
+import io
 import shutil
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
 from pathlib import Path
 
 
 def create_cache_dir():
     """
-    Erstellt einen Ordner namens "cache", sofern dieser noch nicht existiert.
+    Erstellt einen Ordner namens "cache" (siehe cache_path) mit dem Unterordner "sensors", sofern dieser noch nicht existiert.
     """
     try:
-        os.mkdir("cache/sensors")
+        os.makedirs(os.path.join(cache_path, "sensors"))
         print("Cache folder was created.")
     except FileExistsError:
         print("Cache folder already exists.")
@@ -31,21 +42,96 @@ sensor_archive_format_indoor = "https://archive.sensor.community/%year%/%date%/%
 
 # https://archive.sensor.community/2023-01-01/2023-01-01_bme280_sensor_113.csv
 sensor_archive_format_current_year = "https://archive.sensor.community/%date%/%date%_%sensor_type%_sensor_%id%.csv.gz"
+sensor_archive_format_indoor_current_year = "https://archive.sensor.community/%date%/%date%_%sensor_type%_sensor_%id%_indoor.csv.gz"
+
+# Aktuelle Messwerte aller Sensoren, aus denen Sensor-Typen und Innen- / Außenanwendung importiert werden
+sensor_types_url = "https://data.sensor.community/static/v2/data.json"
 
 date_format = "%Y-%m-%dT%H:%M:%S"
 
-create_cache_dir()
-database_connection = sqlite3.connect("./cache/database.db", check_same_thread=False)
+epoch = datetime.datetime(1970, 1, 1)
+
+# Version des Datenbankschemas, wird in PRAGMA user_version gespeichert
+schema_version = 3
+
+# Tabellen mit vorberechneten Aggregaten je Format der Einstellung "sql_date", von der feinsten zur gröbsten Auflösung
+rollup_tables = {"%Y-%m-%d %H": "rollup_hour", "%Y-%m-%d": "rollup_day", "%Y-%m": "rollup_month", "%Y": "rollup_year"}
+
+# Anzahl der Tagesdateien, die gleichzeitig heruntergeladen werden
+download_workers = 8
+
+# Anzahl der Prozesse, auf die das Verarbeiten der Tagesdateien verteilt wird, 0 verarbeitet sie in den Download-Threads
+parse_processes = 0
+
+# Anzahl der Zeilen, die beim Speichern eines Sensors mit einem executemany eingefügt werden
+bulk_insert_chunk_size = 10000
+
+# PRAGMAs, die während des Speicherns eines Sensors gesetzt und danach zurückgesetzt werden.
+# Das Journal bleibt im WAL-Modus, den die Lese-Verbindungen benötigen (siehe ConnectionManager)
+bulk_load_pragmas = {"synchronous": "OFF", "cache_size": "-65536"}
+
+# Anzahl der Lese-Verbindungen, die nach dem Ende ihres Threads für andere Threads offen gehalten werden
+database_idle_readers = 4
+
+# Speichert heruntergeladene Archive gepackt im Cache-Ordner
+cache_archives = True
+
+# Maximale Größe des Cache-Ordners in Bytes einschließlich der Validatoren, None für unbegrenzt.
+# Wird wie database_idle_readers von init übernommen
+cache_max_bytes: int | None = 1024 * 1024 * 1024
+
+# Archive, die höchstens so viele Tage alt sind, können sich auf dem Server noch ändern
+# und werden vor der Verwendung per bedingter Anfrage geprüft, None prüft nie
+cache_revalidate_days: int | None = 2
+
+# Lädt bei einem gewachsenen Archiv nur den angehängten Teil per Range-Anfrage
+archive_range_requests = True
+
+# Zeitlimits in Sekunden für den Verbindungsaufbau und zwischen zwei empfangenen Paketen beim Laden eines Archivs
+archive_request_timeout = (10, 60)
+
+# Anzahl der über das Jahr verteilten Tage, an denen find_sensor_type nach Archiven des Sensors sucht
+sensor_search_samples = 12
+
+# Zeitlimit in Sekunden für eine einzelne Anfrage bei der Suche nach dem Sensortyp
+sensor_search_probe_timeout = 5
+
+# Wie lange eine erfolglose Suche nach dem Sensortyp gespeichert und nicht wiederholt wird
+sensor_search_negative_ttl = datetime.timedelta(days=1)
+
+# Wie lange importierte Sensor-Typen als aktuell gelten, bevor import_sensor_types erneut beim Server nachfragt
+sensor_types_ttl = datetime.timedelta(hours=12)
+
+# Ordner für den Cache und Pfad der Datenbank, werden von init gesetzt
+cache_path = "./cache"
+database_path = "./cache/database.db"
+
+database: ConnectionManager | None = None
+_init_lock = threading.RLock()
+import_thread: threading.Thread | None = None
 
 sensor_id_cache: set[int] = set()
 
+_settings: dict[str, str] | None = None
+_settings_lock = threading.Lock()
+_setting_listeners: list = []
+
+_http_session: requests.Session | None = None
+_http_session_lock = threading.Lock()
+_http_pool_size = 0
+
+# Fehler, durch die ein einzelner Tag beim Laden fehlschlägt, ohne dass die Synchronisation abbricht
+_download_errors = (requests.RequestException, OSError, EOFError, zlib.error)
+
 
 @functools.total_ordering
 class SensorData:
-    def __init__(self, timestamp: datetime.datetime, value: str, value_name: str, sensor_id: int):
+    __slots__ = ("value", "value_name", "timestamp", "sensor_id")
+
+    def __init__(self, timestamp: datetime.datetime, value: float | None, value_name: str, sensor_id: int):
         super().__init__()
         self.value = value
-        self.value_name = value_name
+        self.value_name = sys.intern(value_name)
         self.timestamp = timestamp
         self.sensor_id = sensor_id
 
@@ -55,19 +141,133 @@ class SensorData:
         return self.timestamp == o.timestamp and self.value == o.value and self.value_name == o.value_name and self.sensor_id == o.sensor_id
 
     def __hash__(self):
-        return id(self)
+        return hash((self.timestamp, self.value_name, self.sensor_id))
 
     def __lt__(self, other):
-        if other == self:
-            return True
         if not isinstance(other, SensorData):
-            return False
-        return self.timestamp.__lt__(other.timestamp)
+            return NotImplemented
+        return self.timestamp < other.timestamp
 
     def __str__(self):
         return f"(timestamp={self.timestamp}, value={self.value}, value_name={self.value_name}, sensor_id={self.sensor_id})"
 
 
+class SensorSeries:
+    """
+    Spaltenweise Darstellung aller Werte eines Wertnamens eines Sensors:
+    Zeitstempel in Sekunden seit 1970 (int64) und Werte (float64, fehlende Werte NaN).
+    Einzelne Werte können über den Index oder beim Iterieren als SensorData abgerufen werden.
+    """
+    __slots__ = ("value_name", "sensor_id", "timestamps", "values")
+
+    def __init__(self, value_name: str, sensor_id: int, timestamps: np.ndarray, values: np.ndarray):
+        super().__init__()
+        self.value_name = sys.intern(value_name)
+        self.sensor_id = sensor_id
+        self.timestamps = timestamps
+        self.values = values
+
+    @staticmethod
+    def concat(value_name: str, sensor_id: int, timestamps: list[np.ndarray], values: list[np.ndarray]) -> SensorSeries:
+        """
+        Fügt mehrere Teil-Arrays (z. B. je Tagesdatei) zu einer nach Datum sortierten Reihe zusammen.
+        """
+        series = SensorSeries(value_name, sensor_id, np.concatenate(timestamps), np.concatenate(values))
+        series.sort()
+        return series
+
+    def sort(self):
+        """
+        Sortiert die Reihe stabil nach dem Zeitstempel, sofern sie nicht bereits sortiert ist.
+        """
+        if len(self.timestamps) > 1 and np.any(self.timestamps[1:] < self.timestamps[:-1]):
+            order = np.argsort(self.timestamps, kind="stable")
+            self.timestamps = self.timestamps[order]
+            self.values = self.values[order]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, i: int) -> SensorData:
+        value = float(self.values[i])
+        return SensorData(from_epoch(int(self.timestamps[i])), None if value != value else value, self.value_name,
+                          self.sensor_id)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return f"(value_name={self.value_name}, sensor_id={self.sensor_id}, count={len(self)})"
+
+
+class SensorColumns:
+    """
+    Spaltenweise Darstellung einer Tagesdatei.
+    Die Zeitstempel liegen als Sekunden seit 1970 (int64) vor, die Messwerte je Wertname als float64-Array,
+    in dem fehlende Werte NaN sind.
+    """
+
+    def __init__(self, sensor_type: str, lat: float, lon: float, timestamps: np.ndarray,
+                 values: dict[str, np.ndarray]):
+        super().__init__()
+        self.sensor_type = sensor_type
+        self.lat = lat
+        self.lon = lon
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class SensorAggregate:
+    """
+    Minimum, Maximum, Durchschnitt und Anzahl der Werte eines Wertnamens in einem Zeitabschnitt (bucket),
+    zusammen mit den Zeitpunkten, an denen Minimum und Maximum zuerst aufgetreten sind.
+    """
+
+    def __init__(self, bucket: str, value_name: str, minimum: float, maximum: float, average: float, count: int,
+                 first_time: datetime.datetime, minimum_time: datetime.datetime, maximum_time: datetime.datetime):
+        super().__init__()
+        self.bucket = bucket
+        self.value_name = value_name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.average = average
+        self.count = count
+        self.first_time = first_time
+        self.minimum_time = minimum_time
+        self.maximum_time = maximum_time
+
+    def __str__(self):
+        return f"(bucket={self.bucket}, value_name={self.value_name}, minimum={self.minimum}, maximum={self.maximum}, average={self.average}, count={self.count})"
+
+
+class SensorAggregateSeries:
+    """
+    Spaltenweise Darstellung der Aggregate eines Wertnamens, sortiert nach Zeitabschnitt:
+    Zeitpunkt des ersten Werts im Abschnitt in Sekunden seit 1970 (int64) sowie Minimum, Durchschnitt und Maximum (float64).
+    Wird zum Zeichnen der Graphen verwendet (siehe decimate_min_max).
+    """
+    __slots__ = ("value_name", "timestamps", "minimum", "average", "maximum")
+
+    def __init__(self, value_name: str, timestamps: np.ndarray, minimum: np.ndarray, average: np.ndarray,
+                 maximum: np.ndarray):
+        super().__init__()
+        self.value_name = sys.intern(value_name)
+        self.timestamps = timestamps
+        self.minimum = minimum
+        self.average = average
+        self.maximum = maximum
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __str__(self):
+        return f"(value_name={self.value_name}, count={len(self)})"
+
+
 class Sensor:
     def __init__(self, id: int, type: str, lat: float, lon: float, indoor: int, load_data=True):
         super().__init__()
@@ -76,151 +276,525 @@ class Sensor:
         self.lat = lat
         self.lon = lon
         self.indoor = indoor
-        self.sensor_data: list[SensorData] = []
+        # Tage, die beim Laden nicht heruntergeladen werden konnten (siehe load_sensor_data)
+        self.failed_dates: list[datetime.datetime] = []
         if load_data:
+            self._sensor_data = None
             self.load_data()
         else:
-            self.sensor_data: list[SensorData] = []
+            self._sensor_data: dict[str, SensorSeries] = {}
             self.maximum: dict[str, set: SensorData] = {}
             self.minimum: dict[str, set: SensorData] = {}
             self.average: dict[str, set: SensorData] = {}
+            self.aggregate_series: dict[str, SensorAggregateSeries] = {}
+
+    @property
+    def sensor_data(self) -> dict[str, SensorSeries]:
+        """
+        Die Rohdaten des Sensors je Wertname. Bei einem aus der Datenbank geladenen Sensor werden sie erst
+        beim ersten Zugriff mit sort_data geladen.
+        """
+        if self._sensor_data is None:
+            self._sensor_data = self.sort_data()
+        return self._sensor_data
+
+    @sensor_data.setter
+    def sensor_data(self, sensor_data):
+        self._sensor_data = sensor_data
 
     def load_data(self):
         """
-        Lädt Daten, sortiert sie und berechnet das Maximum, das Minimum und den Durchschnitt.
+        Berechnet das Maximum, das Minimum und den Durchschnitt in einem gemeinsamen Durchlauf (siehe calc_aggregates).
+        Dieselben Werte stehen spaltenweise in aggregate_series bereit.
+        Die Rohdaten werden nicht geladen, sondern erst bei Zugriff auf sensor_data oder über load_series.
         """
-        self.sensor_data = self.sort_data()
-        self.maximum = self.calc_maximum()
-        self.minimum = self.calc_minimum()
-        self.average = self.calc_avg()
+        aggregates = self.calc_aggregates()
+        self.maximum = self._aggregate_values(aggregates, "maximum")
+        self.minimum = self._aggregate_values(aggregates, "minimum")
+        self.average = self._aggregate_values(aggregates, "average")
+        self.aggregate_series = self._aggregate_series(aggregates)
 
-    def sort_data(self) -> dict[str, list[SensorData]]:
+    def sort_data(self) -> dict[str, SensorSeries]:
         """
         Lädt die Sensor-Daten in der Reihenfolge des Datums.
         """
-        sorted_data = {}
-        res = database_connection.execute(f"SELECT * FROM data WHERE sensor_id=? ORDER BY `time`", [self.id])
-        for row in res:
-            if sorted_data.get(row[2]) is None:
-                sorted_data[row[2]] = []
-            sorted_data.get(row[2]).append(SensorData(datetime.datetime.fromisoformat(row[0]), row[3], row[2], row[1]))
-        return sorted_data
+        return self.load_series()
 
-    def calc_maximum(self) -> dict[str, set: SensorData]:
+    def load_series(self, from_time: datetime.datetime | None = None, to_time: datetime.datetime | None = None,
+                    value_names: list[str] | None = None) -> dict[str, SensorSeries]:
         """
-        Lädt alle maximalen Werte der Sensor-Daten.
+        Lädt die Rohdaten je Wertname als SensorSeries, sortiert nach Datum.
+        Optional werden nur die Werte von from_time (einschließlich) bis to_time (ausschließlich)
+        bzw. nur die angegebenen Wertnamen geladen.
+        """
+        from_epoch_time = to_epoch(from_time) if from_time is not None else -2 ** 63
+        to_epoch_time = to_epoch(to_time) if to_time is not None else 2 ** 63 - 1
+
+        series = {}
+        for value_name_id, name in get_connection().execute("SELECT id, name FROM value_names").fetchall():
+            if value_names is not None and name not in value_names:
+                continue
+            rows = get_connection().execute("SELECT `time`, value FROM data "
+                                            "WHERE sensor_id=? AND value_name=? AND `time` >= ? AND `time` < ? "
+                                            "ORDER BY `time`",
+                                            (self.id, value_name_id, from_epoch_time, to_epoch_time)).fetchall()
+            if len(rows) == 0:
+                continue
+            table = np.array(rows, dtype=np.float64)
+            series[name] = SensorSeries(name, self.id, table[:, 0].astype(np.int64), table[:, 1])
+        return series
+
+    def calc_aggregates(self) -> list[SensorAggregate]:
         """
-        maximum = {}
-        res = database_connection.execute(
-            f"SELECT *, MAX(CAST(value AS FLOAT)) as max, strftime(?, time) as month "
+        Berechnet Minimum, Maximum, Durchschnitt und Anzahl der Werte je Zeitabschnitt (Einstellung "sql_date")
+        und Wertname. Für die Formate aus rollup_tables werden die vorberechneten Aggregate gelesen,
+        ansonsten werden sie in einer einzigen Abfrage aus den Rohdaten berechnet.
+        Die Zeitpunkte der Extremwerte werden über Fensterfunktionen bestimmt,
+        bei gleichen Werten zählt der früheste Zeitpunkt.
+        """
+        sql_date = get_setting("sql_date")
+        if sql_date in rollup_tables:
+            return self._read_rollup(rollup_tables[sql_date])
+
+        res = get_connection().execute(
+            f"SELECT bucket, value_names.name, MIN(value), MAX(value), AVG(value), COUNT(value), MIN(`time`), "
+            f"MIN(CASE WHEN value = bucket_min THEN `time` END), MIN(CASE WHEN value = bucket_max THEN `time` END) "
+            f"FROM (SELECT `time`, value_name, value, strftime(?, `time`, 'unixepoch') as bucket, "
+            f"MIN(value) OVER bucket_window as bucket_min, MAX(value) OVER bucket_window as bucket_max "
             f"FROM data "
-            f"WHERE sensor_id=? AND value <> '' "
-            f"AND value IS NOT 'nan' "
-            f"GROUP BY month, value_name;", (get_setting("sql_date"), self.id)).fetchall()
+            f"WHERE sensor_id=? AND value IS NOT NULL "
+            f"WINDOW bucket_window AS (PARTITION BY value_name, strftime(?, `time`, 'unixepoch'))) "
+            f"INNER JOIN value_names ON value_name = value_names.id "
+            f"GROUP BY bucket, value_name;", (sql_date, self.id, sql_date)).fetchall()
+
+        return [SensorAggregate(row[0], row[1], row[2], row[3], row[4], row[5],
+                                from_epoch(row[6]), from_epoch(row[7]), from_epoch(row[8])) for row in res]
+
+    def _read_rollup(self, table: str) -> list[SensorAggregate]:
+        res = get_connection().execute(
+            f"SELECT bucket, value_names.name, minimum, maximum, total / count, count, first_time, "
+            f"minimum_time, maximum_time "
+            f"FROM {table} "
+            f"INNER JOIN value_names ON {table}.value_name = value_names.id "
+            f"WHERE sensor_id=? ORDER BY {table}.value_name, bucket", [self.id]).fetchall()
+
+        return [SensorAggregate(row[0], row[1], row[2], row[3], row[4], row[5],
+                                from_epoch(row[6]), from_epoch(row[7]), from_epoch(row[8])) for row in res]
+
+    def _aggregate_values(self, aggregates: list[SensorAggregate], kind: str) -> dict[str, set: SensorData]:
+        """
+        Wandelt die Aggregate in die Form von maximum, minimum und average um: je Wertname ein Set von SensorData,
+        dessen Zeitstempel der Zeitpunkt des Extremwerts bzw. der Beginn des Zeitabschnitts ist.
+        """
+        values = {}
+        for aggregate in aggregates:
+            if values.get(aggregate.value_name) is None:
+                values[aggregate.value_name] = set()
+            timestamp = {"maximum": aggregate.maximum_time, "minimum": aggregate.minimum_time,
+                         "average": aggregate.first_time}[kind]
+            values[aggregate.value_name].add(SensorData(timestamp, getattr(aggregate, kind), aggregate.value_name,
+                                                        self.id))
+        return values
+
+    def _aggregate_series(self, aggregates: list[SensorAggregate]) -> dict[str, SensorAggregateSeries]:
+        """
+        Wandelt die Aggregate je Wertname in eine nach Zeit sortierte SensorAggregateSeries um.
+        """
+        rows: dict[str, list[tuple[int, float, float, float]]] = {}
+        for aggregate in aggregates:
+            rows.setdefault(aggregate.value_name, []).append(
+                (to_epoch(aggregate.first_time), aggregate.minimum, aggregate.average, aggregate.maximum))
+
+        series = {}
+        for value_name, values in rows.items():
+            table = np.array(values, dtype=np.float64)
+            order = np.argsort(table[:, 0], kind="stable")
+            table = table[order]
+            series[value_name] = SensorAggregateSeries(value_name, table[:, 0].astype(np.int64), table[:, 1],
+                                                       table[:, 2], table[:, 3])
+        return series
 
-        for row in res:
-            if maximum.get(row[2]) is None:
-                maximum[row[2]] = set()
-            maximum[row[2]].add(SensorData(datetime.datetime.fromisoformat(row[0]), row[3], row[2], row[1]))
-        return maximum
+    def calc_maximum(self) -> dict[str, set: SensorData]:
+        """
+        Lädt alle maximalen Werte der Sensor-Daten.
+        """
+        return self._aggregate_values(self.calc_aggregates(), "maximum")
 
     def calc_minimum(self) -> dict[str, set: SensorData]:
         """
         Lädt alle minimalen Werte der Sensor-Daten.
         """
-        minimum = {}
-        res = database_connection.execute(
-            f"SELECT *, MIN(CAST(value AS FLOAT)) as min, strftime(?, time) as month "
-            f"FROM data "
-            f"WHERE sensor_id=? AND value <> '' "
-            f"AND value IS NOT 'nan' "
-            f"GROUP BY month, value_name;", (get_setting("sql_date"), self.id)).fetchall()
-
-        for row in res:
-            if minimum.get(row[2]) is None:
-                minimum[row[2]] = set()
-            minimum[row[2]].add(SensorData(datetime.datetime.fromisoformat(row[0]), row[3], row[2], row[1]))
-        return minimum
+        return self._aggregate_values(self.calc_aggregates(), "minimum")
 
     def calc_avg(self) -> dict[str, set: SensorData]:
         """
         Lädt die durchschnittlichen Sensor-Daten.
         """
-        avg = {}
-        res = database_connection.execute(
-            f"SELECT *, AVG(CAST(value AS FLOAT)) as avg, strftime(?, time) as month "
-            f"FROM data "
-            f"WHERE sensor_id=? AND value <> '' "
-            f"AND value IS NOT 'nan' "
-            f"GROUP BY month, value_name;", (get_setting("sql_date"), self.id)).fetchall()
-        for row in res:
-            if avg.get(row[2]) is None:
-                avg[row[2]] = set()
-            avg[row[2]].add(SensorData(datetime.datetime.fromisoformat(row[0]), row[4], row[2], row[1]))
-        return avg
+        return self._aggregate_values(self.calc_aggregates(), "average")
 
     def __str__(self):
         return f"(id={self.id} type={self.type}, lat={self.lat}, lon={self.lon}, indoor={self.indoor}, sensor_data={self.sensor_data}, sensor_data={self.sensor_data}, maximum={self.maximum}, minimum={self.minimum}, average={self.average})"
 
 
-def create_tables():
+def from_epoch(seconds: int) -> datetime.datetime:
     """
-    Legt die Tabellen für die Datenbank an, wenn sie noch nicht existieren, und fügt einige Standardwerte hinzu
+    Wandelt Sekunden seit 1970, wie sie in der Datenbank gespeichert sind, in ein datetime-Objekt um.
     """
-    database_connection.execute(
-        "CREATE TABLE IF NOT EXISTS sensor_type(sensor_id INTEGER, sensor_type TEXT, indoor INT, PRIMARY KEY (sensor_id))")
+    return epoch + datetime.timedelta(seconds=seconds)
 
-    database_connection.execute(
-        "CREATE TABLE IF NOT EXISTS sensor(id INT PRIMARY KEY, lat INT, lon INT, FOREIGN KEY (id) REFERENCES sensor_type(sensor_id))")
 
-    database_connection.execute(
-        "CREATE TABLE IF NOT EXISTS data(`time` DATE, sensor_id INT, value_name TEXT, value TEXT, "
+def to_epoch(timestamp: datetime.datetime) -> int:
+    """
+    Wandelt ein datetime-Objekt in Sekunden seit 1970 um, wie sie in der Datenbank gespeichert werden.
+    """
+    return (timestamp - epoch) // datetime.timedelta(seconds=1)
+
+
+def decimate_min_max(x: np.ndarray, y: np.ndarray, buckets: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Verkleinert eine nach x sortierte Reihe für die Darstellung auf höchstens 2 * buckets Punkte.
+    Die Reihe wird dazu in buckets gleich große Abschnitte geteilt, von denen jeweils nur Minimum und Maximum
+    in ihrer ursprünglichen Reihenfolge übrig bleiben. Spitzen gehen so auch bei starker Verkleinerung nicht verloren.
+    Fehlende Werte (NaN) werden übersprungen. Ist die Reihe bereits klein genug, wird sie unverändert zurückgegeben.
+    """
+    n = len(x)
+    if buckets <= 0 or n <= 2 * buckets:
+        return x, y
+
+    size = -(-n // buckets)
+    count = -(-n // size)
+    padded = np.full(count * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(count, size)
+    valid = ~np.isnan(rows)
+
+    lowest = np.where(valid, rows, np.inf).argmin(axis=1)
+    highest = np.where(valid, rows, -np.inf).argmax(axis=1)
+    offsets = np.arange(count) * size
+    indices = np.stack([np.minimum(lowest, highest), np.maximum(lowest, highest)], axis=1) + offsets[:, None]
+    indices = np.unique(indices[valid.any(axis=1)])
+    return x[indices], y[indices]
+
+
+def _table_exists(name: str) -> bool:
+    return get_connection().execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                                    [name]).fetchone() is not None
+
+
+def _create_data_table(name: str = "data"):
+    """
+    Legt die Tabelle für die Messwerte an. Werte sind REAL (fehlende Werte NULL), Zeitstempel Sekunden seit 1970
+    und der Wertname ein Verweis auf die Tabelle value_names.
+    Die Tabelle ist ohne ROWID nach (sensor_id, value_name, `time`) geordnet,
+    sodass alle Abfragen für einen Sensor nur dessen Bereich lesen.
+    """
+    get_connection().execute(
+        f"CREATE TABLE IF NOT EXISTS {name}(`time` INTEGER, sensor_id INT, value_name INT, value REAL, "
+        f"PRIMARY KEY (sensor_id, value_name, `time`), "
+        f"FOREIGN KEY (sensor_id) REFERENCES sensor(id), "
+        f"FOREIGN KEY (value_name) REFERENCES value_names(id)) WITHOUT ROWID;")
+
+
+def _migrate_typed_values():
+    """
+    Schema-Version 1: Wandelt die Tabelle data aus Text-Spalten in Zeitstempel als Sekunden seit 1970,
+    REAL-Werte (leere Werte und 'nan' werden zu NULL) und Verweise auf die Tabelle value_names um.
+    """
+    get_connection().execute("ALTER TABLE data RENAME TO data_text")
+    get_connection().execute(
+        "CREATE TABLE data(`time` INTEGER, sensor_id INT, value_name INT, value REAL, "
         "PRIMARY KEY (`time`, sensor_id, value_name), "
-        "FOREIGN KEY (sensor_id) REFERENCES sensor(id));")
+        "FOREIGN KEY (sensor_id) REFERENCES sensor(id), "
+        "FOREIGN KEY (value_name) REFERENCES value_names(id));")
+    get_connection().execute("INSERT OR IGNORE INTO value_names(name) SELECT DISTINCT value_name FROM data_text")
+    get_connection().execute(
+        "INSERT OR IGNORE INTO data(`time`, sensor_id, value_name, value) "
+        "SELECT CAST(strftime('%s', data_text.`time`) AS INTEGER), data_text.sensor_id, value_names.id, "
+        "CASE WHEN data_text.value = '' OR lower(data_text.value) = 'nan' THEN NULL "
+        "ELSE CAST(data_text.value AS REAL) END "
+        "FROM data_text "
+        "INNER JOIN value_names ON data_text.value_name = value_names.name")
+    get_connection().execute("DROP TABLE data_text")
+
+
+def _migrate_sensor_layout():
+    """
+    Schema-Version 2: Baut die Tabelle data als WITHOUT ROWID-Tabelle mit dem Primärschlüssel
+    (sensor_id, value_name, `time`) neu auf.
+    """
+    get_connection().execute("ALTER TABLE data RENAME TO data_time")
+    _create_data_table()
+    get_connection().execute("INSERT OR IGNORE INTO data(`time`, sensor_id, value_name, value) "
+                             "SELECT `time`, sensor_id, value_name, value FROM data_time "
+                             "ORDER BY sensor_id, value_name, `time`")
+    get_connection().execute("DROP TABLE data_time")
+
+
+def _create_rollup_tables():
+    """
+    Legt die Tabellen aus rollup_tables an. Sie enthalten je Sensor, Wertname und Zeitabschnitt
+    Minimum, Maximum, Summe und Anzahl der Werte sowie die Zeitpunkte der Extremwerte und des ersten Werts.
+    """
+    for table in rollup_tables.values():
+        get_connection().execute(
+            f"CREATE TABLE IF NOT EXISTS {table}(sensor_id INT, value_name INT, bucket TEXT, "
+            f"minimum REAL, minimum_time INTEGER, maximum REAL, maximum_time INTEGER, total REAL, count INT, "
+            f"first_time INTEGER, "
+            f"PRIMARY KEY (sensor_id, value_name, bucket)) WITHOUT ROWID;")
+
+
+def update_rollups(sensor_id: int, from_time: int, to_time: int):
+    """
+    Berechnet die vorberechneten Aggregate eines Sensors für alle Zeitabschnitte neu,
+    die den Zeitraum from_time bis to_time (Sekunden seit 1970, einschließlich) berühren.
+    Die feinste Auflösung wird aus den Rohdaten berechnet, jede gröbere aus der jeweils feineren.
+    """
+    formats = list(rollup_tables.keys())
+    finest = formats[0]
+    start = from_epoch(from_time).strftime(finest)
+    end = from_epoch(to_time).strftime(finest)
+
+    with write_transaction() as connection:
+        connection.execute(
+            f"INSERT OR REPLACE INTO {rollup_tables[finest]}(sensor_id, value_name, bucket, minimum, minimum_time, "
+            f"maximum, maximum_time, total, count, first_time) "
+            f"SELECT sensor_id, value_name, bucket, MIN(value), MIN(CASE WHEN value = bucket_min THEN `time` END), "
+            f"MAX(value), MIN(CASE WHEN value = bucket_max THEN `time` END), SUM(value), COUNT(value), MIN(`time`) "
+            f"FROM (SELECT sensor_id, `time`, value_name, value, strftime(?, `time`, 'unixepoch') as bucket, "
+            f"MIN(value) OVER bucket_window as bucket_min, MAX(value) OVER bucket_window as bucket_max "
+            f"FROM data "
+            f"WHERE sensor_id=? AND value_name IN (SELECT id FROM value_names) AND value IS NOT NULL "
+            f"AND `time` >= ? AND `time` < ? "
+            f"WINDOW bucket_window AS (PARTITION BY value_name, strftime(?, `time`, 'unixepoch'))) "
+            f"GROUP BY value_name, bucket;",
+            (finest, sensor_id, from_time - from_time % 3600, to_time - to_time % 3600 + 3600, finest))
+
+        for finer, coarser in zip(formats, formats[1:]):
+            length = len(epoch.strftime(coarser))
+            connection.execute(
+                f"INSERT OR REPLACE INTO {rollup_tables[coarser]}(sensor_id, value_name, bucket, minimum, minimum_time, "
+                f"maximum, maximum_time, total, count, first_time) "
+                f"SELECT sensor_id, value_name, parent, MIN(minimum), MIN(CASE WHEN minimum = parent_min THEN minimum_time END), "
+                f"MAX(maximum), MIN(CASE WHEN maximum = parent_max THEN maximum_time END), SUM(total), SUM(count), "
+                f"MIN(first_time) "
+                f"FROM (SELECT *, substr(bucket, 1, {length}) as parent, "
+                f"MIN(minimum) OVER parent_window as parent_min, MAX(maximum) OVER parent_window as parent_max "
+                f"FROM {rollup_tables[finer]} "
+                f"WHERE sensor_id=? AND substr(bucket, 1, {length}) BETWEEN ? AND ? "
+                f"WINDOW parent_window AS (PARTITION BY value_name, substr(bucket, 1, {length}))) "
+                f"GROUP BY value_name, parent;",
+                (sensor_id, start[:length], end[:length]))
+
+
+def delete_rollups(sensor_id: int | None = None):
+    """
+    Löscht die vorberechneten Aggregate eines Sensors oder, ohne Sensor-ID, aller Sensoren.
+    """
+    with write_transaction() as connection:
+        for table in rollup_tables.values():
+            if sensor_id is None:
+                connection.execute(f"DELETE FROM {table}")
+            else:
+                connection.execute(f"DELETE FROM {table} WHERE sensor_id=?", [sensor_id])
+
+
+def _migrate_rollups():
+    """
+    Schema-Version 3: Berechnet die Tabellen aus rollup_tables für alle vorhandenen Sensoren.
+    """
+    _create_rollup_tables()
+    for sensor_id, from_time, to_time in get_connection().execute(
+            "SELECT sensor_id, MIN(`time`), MAX(`time`) FROM data GROUP BY sensor_id").fetchall():
+        update_rollups(sensor_id, from_time, to_time)
+
+
+def upgrade_database():
+    """
+    Bringt eine bestehende Datenbank auf die aktuelle Schema-Version (schema_version).
+    Jede Migration läuft in einer eigenen Transaktion, danach wird die Datenbank verkleinert.
+    """
+    with write_transaction() as connection:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version >= schema_version:
+            return
+
+        print(f"Upgrading database from version {version} to {schema_version}...")
+        migrations = [_migrate_typed_values, _migrate_sensor_layout, _migrate_rollups]
+        if connection.in_transaction:
+            connection.commit()
+        for target, migration in enumerate(migrations[version:], start=version + 1):
+            connection.execute("BEGIN")
+            try:
+                migration()
+                connection.execute(f"PRAGMA user_version={target}")
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+        connection.execute("VACUUM")
+        connection.execute("PRAGMA optimize")
+        print("Upgraded database.")
+
+
+def create_tables():
+    """
+    Legt die Tabellen für die Datenbank an, wenn sie noch nicht existieren, und fügt einige Standardwerte hinzu.
+    Eine bestehende Tabelle data wird mit upgrade_database auf die aktuelle Schema-Version gebracht.
+    """
+    with write_transaction() as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sensor_type(sensor_id INTEGER, sensor_type TEXT, indoor INT, PRIMARY KEY (sensor_id))")
+
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sensor(id INT PRIMARY KEY, lat INT, lon INT, FOREIGN KEY (id) REFERENCES sensor_type(sensor_id))")
+
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS value_names(id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+
+        if _table_exists("data"):
+            upgrade_database()
+        else:
+            _create_data_table()
+            _create_rollup_tables()
+            connection.execute(f"PRAGMA user_version={schema_version}")
+
+        connection.execute("CREATE TABLE IF NOT EXISTS sync_state(sensor_id INT, year INT, synced_until TEXT, "
+                           "PRIMARY KEY (sensor_id, year))")
 
-    database_connection.execute("CREATE TABLE IF NOT EXISTS sensor_search_types(type TEXT, PRIMARY KEY (type))")
+        connection.execute("CREATE TABLE IF NOT EXISTS sensor_search_types(type TEXT, PRIMARY KEY (type))")
 
-    database_connection.execute("CREATE TABLE IF NOT EXISTS gui_settings(name TEXT, value TEXT, PRIMARY KEY (name))")
+        connection.execute("CREATE TABLE IF NOT EXISTS sensor_types_import(url TEXT, etag TEXT, last_modified TEXT, "
+                           "imported TEXT, PRIMARY KEY (url))")
 
-    database_connection.execute("INSERT OR IGNORE INTO gui_settings(name, value) VALUES "
-                                "('linestyle', 'solid'), "
-                                "('sql_date', '%Y-%m')")
+        connection.execute("CREATE TABLE IF NOT EXISTS sensor_search_misses(sensor_id INT, year INT, indoor INT, "
+                           "checked TEXT, PRIMARY KEY (sensor_id, year, indoor))")
 
-    database_connection.execute("INSERT OR IGNORE INTO sensor_search_types (type) VALUES "
-                                "('sds011'), "
-                                "('bme280'), "
-                                "('dht22'), "
-                                "('htu21d'), "
-                                "('sds021'), "
-                                "('bmp280'), "
-                                "('sps30'), "
-                                "('dnms_(laerm)'), "
-                                "('sht31'), "
-                                "('bmp180')")
+        connection.execute("CREATE TABLE IF NOT EXISTS gui_settings(name TEXT, value TEXT, PRIMARY KEY (name))")
 
-    database_connection.commit()
+        connection.execute("INSERT OR IGNORE INTO gui_settings(name, value) VALUES "
+                           "('linestyle', 'solid'), "
+                           "('sql_date', '%Y-%m')")
 
+        connection.execute("INSERT OR IGNORE INTO sensor_search_types (type) VALUES "
+                           "('sds011'), "
+                           "('bme280'), "
+                           "('dht22'), "
+                           "('htu21d'), "
+                           "('sds021'), "
+                           "('bmp280'), "
+                           "('sps30'), "
+                           "('dnms_(laerm)'), "
+                           "('sht31'), "
+                           "('bmp180')")
 
-def import_sensor_types():
+
+def iter_json_array(chunks, encoding: str = "utf-8"):
     """
-    Importiert Sensor-Typen von den sensor.community-API und speichert sie in einer Datenbanktabelle
+    Liest ein JSON-Array stückweise aus einem Iterator von Bytes und gibt seine Elemente einzeln zurück,
+    ohne das gesamte Dokument im Speicher zu halten.
     """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ""
+    pos = 0
+    started = False
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            buffer += text_decoder.decode(b"", final=True)
+        else:
+            buffer += text_decoder.decode(chunk)
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("JSON document is not an array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if chunk is None:
+                    raise
+                break
+            # Ein Wert ist erst vollständig, wenn ihm ein Trennzeichen folgt,
+            # da Zahlen wie "12", "1." oder "-1.5e" im nächsten Stück weitergehen können
+            if end == len(buffer) or buffer[end] not in " \t\r\n,]":
+                if chunk is not None:
+                    break
+                if end < len(buffer):
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, end)
+            yield value
+            pos = end
+        buffer = buffer[pos:]
+        pos = 0
+
+
+def import_sensor_types(force: bool = False):
+    """
+    Importiert Sensor-Typen von den sensor.community-API und speichert sie in einer Datenbanktabelle.
+    Liegt der letzte Import weniger als sensor_types_ttl zurück, wird nichts getan (außer mit force).
+    Ansonsten wird mit ETag/Last-Modified des letzten Imports beim Server nachgefragt
+    und die Antwort nur bei Änderungen stückweise gelesen, doppelte Einträge zusammengefasst
+    und in einer Transaktion gespeichert.
+    """
+    state = get_connection().execute("SELECT etag, last_modified, imported FROM sensor_types_import WHERE url=?",
+                                     [sensor_types_url]).fetchone()
+    now = datetime.datetime.now()
+    if not force and state is not None and now - datetime.datetime.fromisoformat(state[2]) < sensor_types_ttl:
+        print("Sensor types are up to date.")
+        return
+
+    headers = {}
+    if state is not None and state[0] is not None:
+        headers["If-None-Match"] = state[0]
+    if state is not None and state[1] is not None:
+        headers["If-Modified-Since"] = state[1]
+
     print("Importing Sensor types...")
-    r = requests.get("https://data.sensor.community/static/v2/data.json")
-    json = r.json()
-    for key in json:
-        try:
-            name = key["sensor"]["sensor_type"]["name"].lower().replace(" ", "_")
-            id = int(key["sensor"]["id"])
-            indoor = key["location"]["indoor"]
-            database_connection.execute(f"INSERT OR IGNORE INTO sensor_search_types(type) VALUES ('{name}')")
-            database_connection.execute("INSERT OR IGNORE INTO sensor_type(sensor_id, sensor_type, indoor) "
-                                        "VALUES (?, ?, ?)",
-                                        (id, name, indoor))
-        except AttributeError or ValueError:
-            pass
-    database_connection.commit()
-    print("Imported Sensor types.")
+    try:
+        with get_http_session().get(sensor_types_url, headers=headers, stream=True, timeout=30) as r:
+            if r.status_code == 304:
+                types = sensors = None
+            elif not r.ok:
+                print(f"Error while downloading '{sensor_types_url}'")
+                return
+            else:
+                types = set()
+                sensors = {}
+                for key in iter_json_array(r.iter_content(64 * 1024)):
+                    try:
+                        name = key["sensor"]["sensor_type"]["name"].lower().replace(" ", "_")
+                        id = int(key["sensor"]["id"])
+                        indoor = int(key["location"]["indoor"])
+                    except (KeyError, TypeError, AttributeError, ValueError):
+                        continue
+                    types.add(name)
+                    sensors[id] = (name, indoor)
+            if r.status_code == 304 and state is not None:
+                etag, last_modified = state[0], state[1]
+            else:
+                etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except (requests.RequestException, ValueError):
+        print(f"Error while downloading '{sensor_types_url}'")
+        return
+
+    with write_transaction() as connection:
+        if sensors is not None:
+            connection.executemany("INSERT OR IGNORE INTO sensor_search_types(type) VALUES (?)",
+                                   ((name,) for name in types))
+            connection.executemany("INSERT INTO sensor_type(sensor_id, sensor_type, indoor) VALUES (?, ?, ?) "
+                                   "ON CONFLICT(sensor_id) DO UPDATE SET "
+                                   "sensor_type=excluded.sensor_type, indoor=excluded.indoor",
+                                   ((id, name, indoor) for id, (name, indoor) in sensors.items()))
+        connection.execute("INSERT OR REPLACE INTO sensor_types_import(url, etag, last_modified, imported) "
+                           "VALUES (?, ?, ?, ?)", (sensor_types_url, etag, last_modified, now.isoformat()))
+    print("Imported Sensor types." if sensors is not None else "Sensor types are unchanged.")
 
 
 def get_date_range_year(year: int) -> list[datetime.date]:
@@ -249,41 +823,532 @@ def get_date_range(from_time: datetime.datetime, to_time: datetime.datetime) ->
     return date_list
 
 
-def get_csv_dump(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int):
+class SyncCancelled(Exception):
     """
-    Lädt eine CSV-Datei aus dem Cache-Ordner, wenn diese existiert oder vom Server herunter und gibt den Inhalt als csv.reader zurück.
-    Der Dateiname setzt sich aus Datum, Sensortyp und Sensor-ID zusammen.
+    Wird ausgelöst, wenn ein Vorgang über ein CancellationToken abgebrochen wurde.
     """
-    filename = "cache/sensors/" + ("%date%_%sensor_type%_sensor_%id%" + ["", "_indoor"][indoor > 0] + ".csv") \
-        .replace("%date%", date.strftime("%Y-%m-%d")) \
-        .replace("%sensor_type%", sensor_type) \
-        .replace("%id%", str(sensor_id))
 
-    gz_filename = filename + ".gz"
 
-    if Path(filename).exists():
-        return csv.reader(open(filename, 'r'), dialect='excel')
+class CancellationToken:
+    """
+    Ermöglicht das Abbrechen eines laufenden Downloads oder Speichervorgangs aus einem anderen Thread.
+    Die Funktionen, denen das Token übergeben wird, prüfen es an geeigneten Stellen und lösen dann SyncCancelled aus.
+    Mit registered angemeldete Funktionen (z. B. das Schließen einer laufenden HTTP-Antwort)
+    werden beim Abbrechen sofort aufgerufen, damit blockierende Lesevorgänge abbrechen.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks: dict[int, object] = {}
+        self.keys = itertools.count()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks = list(self.callbacks.values())
+            self.callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wartet höchstens timeout Sekunden auf das Abbrechen und gibt zurück, ob abgebrochen wurde.
+        """
+        return self.event.wait(timeout)
 
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise SyncCancelled()
+
+    @contextlib.contextmanager
+    def registered(self, callback):
+        """
+        Ruft callback auf, falls während des Blocks abgebrochen wird.
+        """
+        with self.lock:
+            cancelled = self.event.is_set()
+            key = next(self.keys)
+            if not cancelled:
+                self.callbacks[key] = callback
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.callbacks.pop(key, None)
+
+
+def _check_cancel(cancel: CancellationToken | None):
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+
+def _registered(cancel: CancellationToken | None, callback):
+    if cancel is None:
+        return contextlib.nullcontext()
+    return cancel.registered(callback)
+
+
+def get_http_session(pool_size: int | None = None) -> requests.Session:
+    """
+    Gibt die gemeinsame HTTP-Session zurück, deren Verbindungen (Keep-Alive) von allen Downloads wiederverwendet werden.
+    Der Verbindungspool umfasst mindestens download_workers Verbindungen. Ist pool_size größer als der bisherige Pool,
+    wird ein entsprechend größerer Pool eingehängt, damit bei pool_size gleichzeitigen Downloads keine Verbindungen
+    verworfen werden müssen.
+    """
+    global _http_session, _http_pool_size
+    pool_size = max(download_workers, 1, pool_size or 0)
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+        if pool_size > _http_pool_size:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+            _http_pool_size = pool_size
+        return _http_session
+
+
+def get_cache_filename(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int) -> str:
+    """
+    Gibt den Pfad der CSV-Datei im Cache-Ordner zurück.
+    Der Dateiname setzt sich aus Datum, Sensortyp und Sensor-ID zusammen.
+    """
+    _require_init()
+    return os.path.join(sensor_cache.path, ("%date%_%sensor_type%_sensor_%id%" + ["", "_indoor"][indoor > 0] + ".csv")
+                        .replace("%date%", date.strftime("%Y-%m-%d"))
+                        .replace("%sensor_type%", sensor_type)
+                        .replace("%id%", str(sensor_id)))
+
+
+def get_archive_url(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int) -> str:
+    """
+    Gibt die URL der gepackten CSV-Datei im Archiv von sensor.community zurück.
+    """
     if date.year == datetime.datetime.now().year:
         url = ([sensor_archive_format_current_year, sensor_archive_format_indoor_current_year][indoor > 0])
     else:
         url = ([sensor_archive_format, sensor_archive_format_indoor][indoor > 0])
-    url = url.replace("%year%", date.strftime("%Y")).replace("%date%", date.strftime("%Y-%m-%d")).replace(
+    return url.replace("%year%", date.strftime("%Y")).replace("%date%", date.strftime("%Y-%m-%d")).replace(
         "%sensor_type%", sensor_type).replace("%id%", str(sensor_id))
-    response = requests.get(url)
+
+
+def get_validator_filename(gz_filename: str) -> str:
+    """
+    Gibt den Pfad der Datei zurück, in der ETag, Last-Modified und Größe eines gepackten Archivs gespeichert werden.
+    """
+    return gz_filename + ".json"
+
+
+def _load_validators(gz_filename: str) -> dict:
+    try:
+        with open(get_validator_filename(gz_filename), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_validators(gz_filename: str, headers):
+    validators = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                  "size": os.path.getsize(gz_filename)}
+    validator_filename = get_validator_filename(gz_filename)
+    with open(validator_filename + ".part", 'w') as file:
+        json.dump(validators, file)
+    os.replace(validator_filename + ".part", validator_filename)
+
+
+def needs_revalidation(date: datetime.date) -> bool:
+    """
+    Prüft, ob das Archiv des Tages so jung ist, dass es sich auf dem Server noch ändern kann (siehe cache_revalidate_days).
+    """
+    if cache_revalidate_days is None:
+        return False
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return (datetime.date.today() - date).days <= cache_revalidate_days
+
+
+class SensorCache:
+    """
+    Verwaltet die gepackten Archive im Cache-Ordner mit einer Obergrenze in Bytes.
+    Ist die Obergrenze überschritten, werden die am längsten nicht verwendeten Dateien gelöscht.
+    Größe und Reihenfolge der Dateien werden in einem Index gehalten, der nur beim ersten Zugriff
+    aus dem Ordner eingelesen wird. Zur Größe eines Archivs zählt die Datei mit seinen Validatoren. Die Zugriffszeit wird als Änderungszeit der Datei gespeichert,
+    damit die Reihenfolge auch nach einem Neustart erhalten bleibt.
+    """
+
+    def __init__(self, path: str, max_bytes: int | None = None):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: collections.OrderedDict[str, int] | None = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load_index(self):
+        if self.entries is not None:
+            return
+        files = []
+        validator_sizes = {}
+        for t in os.scandir(self.path):
+            if t.name.endswith(".csv.gz"):
+                stat = t.stat()
+                files.append((stat.st_mtime, t.name, stat.st_size))
+            elif t.name.endswith(".csv.gz.json"):
+                validator_sizes[t.name] = t.stat().st_size
+        files.sort()
+        self.entries = collections.OrderedDict((name, size + validator_sizes.get(get_validator_filename(name), 0))
+                                               for _, name, size in files)
+        self.size = sum(self.entries.values())
+
+    def lookup(self, filename: str) -> bool:
+        """
+        Prüft, ob eine Datei im Cache liegt, und markiert sie in diesem Fall als zuletzt verwendet.
+        """
+        name = os.path.basename(filename)
+        with self.lock:
+            self._load_index()
+            if name not in self.entries:
+                self.misses += 1
+                return False
+            self.hits += 1
+            self.entries.move_to_end(name)
+        try:
+            os.utime(os.path.join(self.path, name))
+        except OSError:
+            pass
+        return True
+
+    def add(self, filename: str):
+        """
+        Nimmt eine neu abgelegte Datei in den Index auf und löscht bei Bedarf alte Dateien.
+        """
+        name = os.path.basename(filename)
+        size = os.path.getsize(os.path.join(self.path, name))
+        try:
+            size += os.path.getsize(os.path.join(self.path, get_validator_filename(name)))
+        except OSError:
+            pass
+        with self.lock:
+            self._load_index()
+            self.size += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+            self._evict()
+
+    def discard(self, filename: str):
+        """
+        Entfernt eine Datei aus dem Index, z. B. wenn sie außerhalb des Caches gelöscht wurde.
+        """
+        with self.lock:
+            if self.entries is not None:
+                self.size -= self.entries.pop(os.path.basename(filename), 0)
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            for t in (name, get_validator_filename(name)):
+                try:
+                    os.remove(os.path.join(self.path, t))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """
+        Löscht alle Dateien im Cache-Ordner und leert den Index.
+        """
+        with self.lock:
+            for t in os.scandir(self.path):
+                if t.name.endswith(".csv") or t.name.endswith(".csv.gz") or t.name.endswith(".csv.gz.json"):
+                    os.remove(t)
+            self.entries = collections.OrderedDict()
+            self.size = 0
+
+    def set_path(self, path: str):
+        """
+        Wechselt den Cache-Ordner. Der Index wird beim nächsten Zugriff neu eingelesen.
+        """
+        with self.lock:
+            self.path = path
+            self.entries = None
+            self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Gibt die Anzahl der Treffer, Fehlzugriffe und gelöschten Dateien sowie die aktuelle Größe zurück.
+        """
+        with self.lock:
+            self._load_index()
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "files": len(self.entries), "size": self.size}
+
+
+sensor_cache = SensorCache(os.path.join(cache_path, "sensors"), cache_max_bytes)
+
+
+class _ArchiveReader(io.RawIOBase):
+    """
+    Liest ein gepacktes Archiv direkt aus einer HTTP-Antwort.
+    Ist ein Cache-Dateiname angegeben, werden die gelesenen Bytes gleichzeitig dorthin geschrieben.
+    Die Datei wird erst nach vollständigem Lesen unter ihrem endgültigen Namen abgelegt.
+    Wird das optionale CancellationToken abgebrochen, wird die Verbindung geschlossen und SyncCancelled ausgelöst.
+    """
+
+    def __init__(self, response: requests.Response, cache_filename: str | None = None,
+                 cancel: CancellationToken | None = None):
+        super().__init__()
+        self.response = response
+        self.cache_filename = cache_filename
+        self.cancel = cancel
+        self.cache_file = open(cache_filename + ".part", 'wb') if cache_filename is not None else None
+        self.complete = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        _check_cancel(self.cancel)
+        try:
+            n = self.response.raw.readinto(b)
+        except Exception:
+            _check_cancel(self.cancel)
+            raise
+        if n == 0:
+            self.complete = True
+        elif self.cache_file is not None:
+            self.cache_file.write(memoryview(b)[:n])
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        self.response.close()
+        if self.cache_file is not None:
+            self.cache_file.close()
+            if self.complete:
+                os.replace(self.cache_file.name, self.cache_filename)
+                _store_validators(self.cache_filename, self.response.headers)
+                sensor_cache.add(self.cache_filename)
+            else:
+                os.remove(self.cache_file.name)
+        super().close()
+
+
+def _write_cached_archive(gz_filename: str, content: bytes, headers):
+    """
+    Legt ein gepacktes Archiv zusammen mit seinen Validatoren im Cache-Ordner ab.
+    """
+    with open(gz_filename + ".part", 'wb') as file:
+        file.write(content)
+    os.replace(gz_filename + ".part", gz_filename)
+    _store_validators(gz_filename, headers)
+    sensor_cache.add(gz_filename)
+
+
+def _is_complete_archive(content: bytes) -> bool:
+    try:
+        gzip.decompress(content)
+    except (OSError, EOFError, zlib.error):
+        return False
+    return True
+
+
+def revalidate_archive(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int):
+    """
+    Prüft ein Archiv im Cache-Ordner mit einer bedingten Anfrage (If-None-Match/If-Modified-Since) gegen den Server.
+    Ist es unverändert, antwortet der Server ohne Inhalt (304). Ist es nur gewachsen, wird mit archive_range_requests
+    nur der angehängte Teil geladen und das Ergebnis anhand der Prüfsumme des Archivs kontrolliert,
+    ansonsten wird das Archiv vollständig neu geladen. Ist der Server nicht erreichbar, bleibt der Cache unverändert.
+    """
+    gz_filename = get_cache_filename(date, sensor_type, sensor_id, indoor) + ".gz"
+    if not Path(gz_filename).exists():
+        return
+
+    validators = _load_validators(gz_filename)
+    size = os.path.getsize(gz_filename)
+    headers = {}
+    if validators.get("etag") is not None:
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified") is not None:
+        headers["If-Modified-Since"] = validators["last_modified"]
+    if archive_range_requests and len(headers) > 0 and validators.get("size") == size:
+        headers["Range"] = f"bytes={size}-"
+
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    session = get_http_session()
+    try:
+        response = session.get(url, headers=headers, timeout=archive_request_timeout)
+        if response.status_code == 304:
+            return
+
+        content = None
+        if response.status_code == 206 and response.headers.get("Content-Range", "").startswith(f"bytes {size}-"):
+            with open(gz_filename, 'rb') as file:
+                content = file.read() + response.content
+            if not _is_complete_archive(content):
+                content = None
+        if content is None and response.status_code in (206, 416):
+            response = session.get(url, timeout=archive_request_timeout)
+    except requests.RequestException:
+        print(f"Error while revalidating '{url}'")
+        return
+
+    if content is None:
+        if not response.ok:
+            print(f"Error while revalidating '{url}'")
+            return
+        content = response.content
+    print(f"Updating '{url}'...")
+    _write_cached_archive(gz_filename, content, response.headers)
+
+
+def _open_cached_csv_dump(filename: str):
+    """
+    Öffnet eine CSV-Datei aus dem Cache-Ordner als Text-Stream oder gibt None zurück, wenn sie nicht im Cache liegt.
+    """
+    if Path(filename).exists():
+        return open(filename, 'r')
+    gz_filename = filename + ".gz"
+    if sensor_cache.lookup(gz_filename):
+        try:
+            return gzip.open(gz_filename, 'rt')
+        except FileNotFoundError:
+            sensor_cache.discard(gz_filename)
+    return None
+
+
+@contextlib.contextmanager
+def open_csv_dump(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int, cache: bool | None = None,
+                  cancel: CancellationToken | None = None):
+    """
+    Öffnet eine CSV-Datei als Text-Stream. Liegt sie im Cache-Ordner, wird sie von dort gelesen,
+    ansonsten wird das Archiv vom Server heruntergeladen und beim Lesen entpackt, ohne es vorher abzuspeichern.
+    Ist cache (Standard: cache_archives) gesetzt, wird dabei nur die gepackte Datei im Cache-Ordner abgelegt.
+    Archive der letzten Tage werden vorher mit revalidate_archive geprüft.
+    Existiert die Datei auf dem Server nicht (404), wird None geliefert,
+    bei anderen Fehlern des Servers wird requests.HTTPError ausgelöst.
+    Mit einem CancellationToken kann der Download abgebrochen werden (siehe _ArchiveReader).
+    """
+    if cache is None:
+        cache = cache_archives
+    _check_cancel(cancel)
+
+    filename = get_cache_filename(date, sensor_type, sensor_id, indoor)
+    gz_filename = filename + ".gz"
+
+    if needs_revalidation(date):
+        revalidate_archive(date, sensor_type, sensor_id, indoor)
+
+    cached = _open_cached_csv_dump(filename)
+    if cached is not None:
+        with cached as file:
+            yield file
+        return
+
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    response = get_http_session().get(url, stream=True, timeout=archive_request_timeout)
+    if cancel is not None and cancel.cancelled:
+        response.close()
+        cancel.raise_if_cancelled()
     if not response.ok:
+        response.close()
         print(f"Error while downloading '{url}'")
-        return
+        if response.status_code == 404:
+            yield None
+            return
+        response.raise_for_status()
     print(f"Downloading '{url}'...")
 
-    with open(gz_filename, 'wb') as file:
-        file.write(response.content)
+    with _ArchiveReader(response, gz_filename if cache else None, cancel) as archive, \
+            _registered(cancel, response.close):
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=archive, mode='rb')) as file:
+            yield file
+
+
+def fetch_csv_dump(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                   cache: bool | None = None, cancel: CancellationToken | None = None) -> bytes | None:
+    """
+    Lädt den unverarbeiteten Inhalt einer CSV-Datei aus dem Cache-Ordner oder vom Server und gibt ihn als Bytes zurück,
+    vom Server also noch gepackt. Ist cache (Standard: cache_archives) gesetzt,
+    wird die gepackte Datei im Cache-Ordner abgelegt. Archive der letzten Tage werden vorher mit revalidate_archive geprüft.
+    Existiert die Datei auf dem Server nicht (404), wird None zurückgegeben,
+    bei anderen Fehlern des Servers wird requests.HTTPError ausgelöst.
+    Mit einem CancellationToken kann der Download abgebrochen werden.
+    """
+    if cache is None:
+        cache = cache_archives
+    _check_cancel(cancel)
 
-    with gzip.open(gz_filename, 'rb') as f_in:
-        with open(filename, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
+    filename = get_cache_filename(date, sensor_type, sensor_id, indoor)
+    gz_filename = filename + ".gz"
+
+    if needs_revalidation(date):
+        revalidate_archive(date, sensor_type, sensor_id, indoor)
+
+    if Path(filename).exists():
+        with open(filename, 'rb') as file:
+            return file.read()
+    if sensor_cache.lookup(gz_filename):
+        try:
+            with open(gz_filename, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            sensor_cache.discard(gz_filename)
+
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    response = get_http_session().get(url, stream=True, timeout=archive_request_timeout)
+    if cancel is not None and cancel.cancelled:
+        response.close()
+        cancel.raise_if_cancelled()
+    if not response.ok:
+        response.close()
+        print(f"Error while downloading '{url}'")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+    print(f"Downloading '{url}'...")
 
-    return csv.reader(open(filename, 'r'), dialect='excel')
+    with _registered(cancel, response.close):
+        try:
+            content = response.content
+        except Exception:
+            _check_cancel(cancel)
+            raise
+    _check_cancel(cancel)
+    if cache:
+        _write_cached_archive(gz_filename, content, response.headers)
+    return content
+
+
+def get_csv_dump(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                 cancel: CancellationToken | None = None):
+    """
+    Lädt eine CSV-Datei aus dem Cache-Ordner, wenn diese existiert oder vom Server herunter und gibt den Inhalt als csv.reader zurück.
+    Der Dateiname setzt sich aus Datum, Sensortyp und Sensor-ID zusammen.
+    Mit einem CancellationToken kann der Download abgebrochen werden.
+    """
+    with open_csv_dump(date, sensor_type, sensor_id, indoor, cancel=cancel) as file:
+        if file is None:
+            return None
+        return csv.reader(io.StringIO(file.read()), dialect='excel')
 
 
 def clear_cache(clear_all: bool = False):
@@ -294,26 +1359,49 @@ def clear_cache(clear_all: bool = False):
     """
 
     print("Clearing cache...")
-    g = os.scandir("./cache/sensors")
-    for t in g:
-        if t.name.endswith(".csv"):
-            os.remove(t)
+    sensor_cache.clear()
     print("Cache folder was cleared.")
 
     if clear_all:
-        database_connection.execute("DELETE FROM sensor")
-        database_connection.execute("DELETE FROM data")
-        database_connection.execute("DELETE FROM sensor_type")
-        database_connection.commit()
+        with write_transaction() as connection:
+            connection.execute("DELETE FROM sensor")
+            connection.execute("DELETE FROM data")
+            delete_rollups()
+            connection.execute("DELETE FROM sync_state")
+            connection.execute("DELETE FROM sensor_search_misses")
+            connection.execute("DELETE FROM sensor_type")
         print("Database was cleared.")
 
 
+def compress_cache():
+    """
+    Packt alle noch ungepackten CSV-Dateien im Ordner "sensors" des Caches und löscht die ursprünglichen Dateien,
+    sodass im Cache nur noch die gepackten Archive liegen (einmalige Umstellung älterer Caches).
+    Existiert das gepackte Archiv bereits, wird nur die CSV-Datei gelöscht.
+    """
+    plain_files = [t.path for t in os.scandir(sensor_cache.path) if t.name.endswith(".csv")]
+    if len(plain_files) == 0:
+        return
+
+    print(f"Compressing {len(plain_files)} cached files...")
+    for filename in plain_files:
+        gz_filename = filename + ".gz"
+        if not Path(gz_filename).exists():
+            with open(filename, 'rb') as f_in:
+                with gzip.open(gz_filename + ".part", 'wb', compresslevel=6) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            os.replace(gz_filename + ".part", gz_filename)
+            sensor_cache.add(gz_filename)
+        os.remove(filename)
+    print("Cache folder was compressed.")
+
+
 def load_sensor_cache():
     """
     Leert den Sensor-Cache und füllt ihn mit den IDs der in der Datenbank vorhandenen Sensoren
     """
     sensor_id_cache.clear()
-    for id in database_connection.execute("SELECT id FROM sensor").fetchall():
+    for id in get_connection().execute("SELECT id FROM sensor").fetchall():
         sensor_id_cache.add(id[0])
     print(f"sensor_id_cache: {sensor_id_cache}")
 
@@ -330,7 +1418,7 @@ def exists_in_database(id: int) -> bool:
     Prüft, ob ein Sensor bereits in der Datenbank existiert.
     """
     int(id)
-    return len(database_connection.execute(f"SELECT id FROM sensor WHERE id=?", [id]).fetchall()) > 0
+    return len(get_connection().execute(f"SELECT id FROM sensor WHERE id=?", [id]).fetchall()) > 0
 
 
 def get_sensor_types() -> set[str]:
@@ -339,7 +1427,7 @@ def get_sensor_types() -> set[str]:
     die in der Datenbank gespeichert sind.
     """
     types = set()
-    res = database_connection.execute("SELECT DISTINCT (type) FROM sensor_search_types ORDER BY type").fetchall()
+    res = get_connection().execute("SELECT DISTINCT (type) FROM sensor_search_types ORDER BY type").fetchall()
     for row in res:
         types.add(row[0])
     return types
@@ -352,12 +1440,53 @@ def has_data_in_year(id: int, year: int) -> bool:
     """
     int(id)
     int(year)
-    return len(database_connection.execute("SELECT sensor_id FROM data WHERE "
-                                           f"date(`time`) >= date('{year}-01-01') AND date(`time`) <= date('{year}-12-31') "
-                                           f"AND sensor_id={id}").fetchall()) > 0
+    return get_connection().execute("SELECT EXISTS(SELECT 1 FROM data "
+                                    "WHERE sensor_id=? AND value_name IN (SELECT id FROM value_names) "
+                                    "AND `time` >= ? AND `time` < ?)",
+                                    (id, to_epoch(datetime.datetime(year, 1, 1)),
+                                        to_epoch(datetime.datetime(year + 1, 1, 1)))).fetchone()[0] == 1
 
 
-def save_in_database(sid):
+@contextlib.contextmanager
+def bulk_load_transaction():
+    """
+    Führt den Block in einer expliziten Transaktion auf der Schreibverbindung aus (siehe write_transaction).
+    Währenddessen sind die PRAGMAs aus bulk_load_pragmas gesetzt, danach werden die vorherigen Werte wiederhergestellt.
+    Bei einem Fehler wird die Transaktion zurückgerollt. Lesende Threads werden dabei nicht blockiert.
+    """
+    with write_transaction() as connection:
+        if connection.in_transaction:
+            connection.commit()
+
+        previous = {name: connection.execute(f"PRAGMA {name}").fetchone()[0] for name in bulk_load_pragmas}
+        for name, value in bulk_load_pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        try:
+            connection.execute("BEGIN")
+            try:
+                yield connection
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+        finally:
+            for name, value in previous.items():
+                connection.execute(f"PRAGMA {name}={value}")
+
+
+def get_value_name_ids(names) -> dict[str, int]:
+    """
+    Gibt die IDs der angegebenen Wertnamen aus der Tabelle value_names zurück und legt fehlende Namen an.
+    """
+    with write_transaction() as connection:
+        ids = {}
+        for name in names:
+            connection.execute("INSERT OR IGNORE INTO value_names(name) VALUES (?)", [name])
+            ids[name] = connection.execute("SELECT id FROM value_names WHERE name=?", [name]).fetchone()[0]
+    return ids
+
+
+def save_in_database(sid, callback=None, cancel: CancellationToken | None = None):
     """
     Speichert ein Sensor- oder Sensor-Daten-Objekt in der Datenbank.
     Wenn es sich um ein SensorData-Objekt handelt, werden der Zeitstempel,
@@ -365,29 +1494,57 @@ def save_in_database(sid):
 
     Wenn es sich um ein Sensor-Objekt handelt, werden die Sensor-ID, der Sensortyp,
     die Koordinaten und die Indoor-Eigenschaft in die sensor_type- und sensor-Tabellen eingefügt.
-    Die Sensor-Daten werden ebenfalls in die data-Tabelle eingefügt.
+    Die Sensor-Daten werden ebenfalls in die data-Tabelle eingefügt, blockweise mit executemany
+    in einer einzigen Transaktion (siehe bulk_load_transaction).
+    Anschließend werden die vorberechneten Aggregate für den betroffenen Zeitraum aktualisiert.
+    Ein Fortschritts-Callback kann optional angegeben werden.
+    Wird das optionale CancellationToken abgebrochen, wird nach dem aktuellen Block SyncCancelled ausgelöst
+    und die Transaktion vollständig zurückgerollt.
     """
 
     if isinstance(sid, SensorData):
-        database_connection.execute("INSERT OR IGNORE INTO data(`time`, value_name, value, sensor_id) VALUES "
-                                    "(?, ?, ?, ?)",
-                                    (sid.timestamp, sid.value_name, sid.value, sid.sensor_id))
+        with write_transaction() as connection:
+            value_name_ids = get_value_name_ids([sid.value_name])
+            connection.execute("INSERT OR IGNORE INTO data(`time`, value_name, value, sensor_id) VALUES "
+                               "(?, ?, ?, ?)",
+                               (to_epoch(sid.timestamp), value_name_ids[sid.value_name], sid.value,
+                                sid.sensor_id))
+            update_rollups(sid.sensor_id, to_epoch(sid.timestamp), to_epoch(sid.timestamp))
     elif isinstance(sid, Sensor):
-        database_connection.execute("INSERT OR IGNORE INTO sensor_type(sensor_id, sensor_type, indoor) VALUES "
-                                    "(?, ?, ?)",
-                                    (sid.id, sid.type.lower(), sid.indoor))
-
-        database_connection.execute("INSERT OR IGNORE INTO sensor(id, lat, lon) VALUES "
-                                    "(?, ?, ?)",
-                                    (sid.id, sid.lat, sid.lon))
-        for sd in sid.sensor_data:
-            database_connection.execute("INSERT OR IGNORE INTO data(`time`, value_name, value, sensor_id) VALUES "
-                                        "(?, ?, ?, ?)",
-                                        (sd.timestamp, sd.value_name, sd.value, sd.sensor_id))
-
-    else:
-        return
-    database_connection.commit()
+        total = sum(len(series) for series in sid.sensor_data.values())
+        saved = 0
+
+        with bulk_load_transaction() as connection:
+            value_name_ids = get_value_name_ids(sid.sensor_data.keys())
+            rows = itertools.chain.from_iterable(
+                zip(series.timestamps.tolist(), itertools.repeat(value_name_ids[value_name]),
+                    [None if v != v else v for v in series.values.tolist()], itertools.repeat(sid.id))
+                for value_name, series in sid.sensor_data.items())
+
+            connection.execute("INSERT OR IGNORE INTO sensor_type(sensor_id, sensor_type, indoor) VALUES "
+                               "(?, ?, ?)",
+                               (sid.id, sid.type.lower(), sid.indoor))
+
+            connection.execute("INSERT OR IGNORE INTO sensor(id, lat, lon) VALUES "
+                               "(?, ?, ?)",
+                               (sid.id, sid.lat, sid.lon))
+
+            while True:
+                _check_cancel(cancel)
+                chunk = list(itertools.islice(rows, bulk_insert_chunk_size))
+                if len(chunk) == 0:
+                    break
+                connection.executemany("INSERT OR IGNORE INTO data(`time`, value_name, value, sensor_id) "
+                                       "VALUES (?, ?, ?, ?)", chunk)
+                saved += len(chunk)
+                if callback is not None:
+                    callback(percentage(total, saved), total, saved)
+
+            _check_cancel(cancel)
+            if total > 0:
+                update_rollups(sid.id,
+                               min(int(series.timestamps.min()) for series in sid.sensor_data.values() if len(series)),
+                               max(int(series.timestamps.max()) for series in sid.sensor_data.values() if len(series)))
 
 
 def get_sensor(id: int) -> Sensor | None:
@@ -399,7 +1556,7 @@ def get_sensor(id: int) -> Sensor | None:
     """
     if exists_in_database(id):
         print(f"Loading sensor '{id}' from database...")
-        rs = database_connection.execute(
+        rs = get_connection().execute(
             f"SELECT sensor.id, sensor_type.sensor_type, sensor.lat, sensor.lon, sensor_type.indoor "
             f"FROM sensor "
             f"INNER JOIN sensor_type on sensor.id = sensor_type.sensor_id "
@@ -411,61 +1568,495 @@ def get_sensor(id: int) -> Sensor | None:
     return None
 
 
-def load_sensor_data(year: int, sensor_type: str, sensor_id: int, indoor: int, callback=None) -> Sensor:
+def _parse_float_column(column: np.ndarray) -> np.ndarray:
+    """
+    Wandelt eine Spalte aus Zeichenketten in ein float64-Array um. Leere oder ungültige Werte werden zu NaN.
+    """
+    column = np.where(column == "", "nan", column)
+    try:
+        return column.astype(np.float64)
+    except ValueError:
+        parsed = np.empty(len(column), dtype=np.float64)
+        for i, value in enumerate(column):
+            try:
+                parsed[i] = float(value)
+            except ValueError:
+                parsed[i] = np.nan
+        return parsed
+
+
+def parse_csv_columns(lines: list[str]) -> SensorColumns | None:
+    """
+    Verarbeitet die Zeilen einer CSV-Datei auf einmal und gibt sie als SensorColumns zurück.
+    Die Zeitstempel werden einmal pro Zeile umgewandelt, die Messwerte spaltenweise.
+    Enthält die Datei keine Werte, wird None zurückgegeben.
+    """
+    if len(lines) < 2:
+        return None
+
+    value_names = lines[0].split(";")
+    column_count = len(value_names)
+    rows = [line for line in lines[1:] if line != ""]
+    if len(rows) == 0:
+        return None
+
+    if all(row.count(";") == column_count - 1 for row in rows):
+        table = np.array(";".join(rows).split(";")).reshape(len(rows), column_count)
+    else:
+        table = np.array([(row.split(";") + [""] * column_count)[:column_count] for row in rows])
+
+    timestamps = table[:, 5].astype("datetime64[s]").astype(np.int64)
+    values = {value_names[vi]: _parse_float_column(table[:, vi]) for vi in range(6, column_count)}
+    return SensorColumns(str(table[-1, 1]), float(table[-1, 3]), float(table[-1, 4]), timestamps, values)
+
+
+def parse_csv_archive(content: bytes) -> SensorColumns | None:
+    """
+    Entpackt den mit fetch_csv_dump geladenen Inhalt, falls nötig, und verarbeitet ihn mit parse_csv_columns.
+    Die Funktion wird auch in den Prozessen von load_sensor_data ausgeführt und gibt deshalb nur
+    die kompakten Spalten zurück.
+    """
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    return parse_csv_columns(content.decode().splitlines())
+
+
+def _load_csv_dump_in_process(process_executor: ProcessPoolExecutor, date: datetime.date, sensor_type: str,
+                              sensor_id: int, indoor: int,
+                              cancel: CancellationToken | None = None) -> SensorColumns | None:
+    """
+    Lädt die CSV-Datei eines Tages im aktuellen Thread und lässt sie in einem Prozess des Pools verarbeiten.
+    """
+    content = fetch_csv_dump(date, sensor_type, sensor_id, indoor, cancel=cancel)
+    if content is None:
+        return None
+    _check_cancel(cancel)
+    return process_executor.submit(parse_csv_archive, content).result()
+
+
+def load_csv_dump(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                  cancel: CancellationToken | None = None) -> SensorColumns | None:
+    """
+    Lädt die CSV-Datei eines Tages, entpackt sie beim Empfangen und verarbeitet sie mit parse_csv_columns.
+    Existiert die Datei auf dem Server nicht oder enthält sie keine Werte, wird None zurückgegeben.
+    Mit einem CancellationToken kann der Download abgebrochen werden.
+    """
+    with open_csv_dump(date, sensor_type, sensor_id, indoor, cancel=cancel) as file:
+        if file is None:
+            return None
+        return parse_csv_columns(file.read().splitlines())
+
+
+def load_csv_dumps(dates: list[datetime.date], sensor_type: str, sensor_id: int, indoor: int,
+                   workers: int | None = None, process_executor: ProcessPoolExecutor | None = None,
+                   cancel: CancellationToken | None = None, failed_dates: list | None = None):
+    """
+    Lädt und verarbeitet die CSV-Dateien für alle angegebenen Tage gleichzeitig über einen begrenzten Pool von Threads.
+    Ist ein process_executor angegeben, werden die Dateien in dessen Prozessen verarbeitet.
+    Die Ergebnisse (SensorColumns oder None) werden in der Reihenfolge der Tage zurückgegeben,
+    sobald sie verfügbar sind.
+    Wird das CancellationToken abgebrochen, wird sofort SyncCancelled ausgelöst. Noch nicht gestartete Downloads
+    werden verworfen und laufende Verbindungen geschlossen, ohne auf Anfragen zu warten, die noch keine Antwort
+    erhalten haben (diese enden spätestens nach archive_request_timeout).
+    Ist failed_dates angegeben, werden Tage, die nicht geladen werden konnten (z. B. Fehler des Servers),
+    dort eingetragen und als None zurückgegeben, ansonsten wird der Fehler weitergegeben.
+    """
+    if workers is None:
+        workers = download_workers
+    workers = max(int(workers), 1)
+    # Pool der Session an die Anzahl gleichzeitiger Downloads anpassen
+    get_http_session(workers)
+
+    # Wird beim Abbrechen erfüllt, damit das Warten auf den nächsten Tag sofort endet
+    stop = Future()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        if process_executor is None:
+            futures = [executor.submit(load_csv_dump, d, sensor_type, sensor_id, indoor, cancel) for d in dates]
+        else:
+            futures = [executor.submit(_load_csv_dump_in_process, process_executor, d, sensor_type, sensor_id, indoor,
+                                       cancel)
+                       for d in dates]
+        with _registered(cancel, lambda: stop.set_result(None)):
+            for d, future in zip(dates, futures):
+                wait([future, stop], return_when=FIRST_COMPLETED)
+                _check_cancel(cancel)
+                try:
+                    columns = future.result()
+                except _download_errors as e:
+                    if failed_dates is None:
+                        raise
+                    print(f"Error while loading {d}: {e}")
+                    failed_dates.append(d)
+                    columns = None
+                yield columns
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _build_series(sensor_id: int, days: list[SensorColumns | None]) -> dict[str, SensorSeries]:
+    """
+    Fügt die Spalten der einzelnen Tagesdateien je Wertname zu SensorSeries zusammen.
+    """
+    timestamps: dict[str, list[np.ndarray]] = {}
+    values: dict[str, list[np.ndarray]] = {}
+    for columns in days:
+        if columns is None:
+            continue
+        for value_name, column in columns.values.items():
+            timestamps.setdefault(value_name, []).append(columns.timestamps)
+            values.setdefault(value_name, []).append(column)
+    return {value_name: SensorSeries.concat(value_name, sensor_id, timestamps[value_name], values[value_name])
+            for value_name in timestamps}
+
+
+def _apply_columns(sensor: Sensor, columns: SensorColumns):
+    """
+    Übernimmt Typ und Koordinaten des Sensors aus einer verarbeiteten Tagesdatei.
+    """
+    sensor.type = columns.sensor_type
+    sensor.lat = columns.lat
+    sensor.lon = columns.lon
+
+
+def load_sensor_data(year: int, sensor_type: str, sensor_id: int, indoor: int, callback=None,
+                     workers: int | None = None, processes: int | None = None,
+                     process_executor: ProcessPoolExecutor | None = None,
+                     dates: list[datetime.datetime] | None = None,
+                     cancel: CancellationToken | None = None) -> Sensor:
     """
     Lädt die Sensor-Daten für einen bestimmten Sensor-Typ und eine Sensor-ID für das angegebene Jahr.
-    Sie ruft eine CSV-Datei ab, verarbeitet die Daten und speichert sie als Sensor-Objekt ab.
-    Die Funktion gibt das Sensor-Objekt zurück.
+    Die CSV-Dateien werden gleichzeitig mit bis zu workers Threads (Standard: download_workers) heruntergeladen,
+    beim Empfangen verarbeitet und in der Reihenfolge des Datums als Sensor-Objekt abgespeichert.
+    Ist processes (Standard: parse_processes) größer als 0 oder ein process_executor angegeben,
+    werden die Dateien stattdessen in mehreren Prozessen verarbeitet, um alle Prozessorkerne zu nutzen.
+    Ist dates angegeben (z. B. von plan_sync), werden nur diese Tage geladen.
+    Die Funktion gibt das Sensor-Objekt zurück. Tage, die nicht geladen werden konnten,
+    stehen in dessen failed_dates und sollten an mark_synced übergeben werden.
     Ein Fortschritts-Callback kann optional angegeben werden.
+    Mit einem CancellationToken kann das Laden abgebrochen werden, dann wird SyncCancelled ausgelöst.
     """
-    dr = get_date_range_year(year)
+    dr = get_date_range_year(year) if dates is None else dates
     drl = len(dr)
     i = 0
 
-    data_list: list[SensorData] = []
+    days: list[SensorColumns] = []
     sensor = Sensor(sensor_id, "type", 0, 0, indoor, load_data=False)
 
-    # w=g*p
-    for i, d in enumerate(dr):
-        if callback is not None:
-            callback(percentage(drl, i), drl, i)
-        cvs_reader = get_csv_dump(d, sensor_type, sensor_id, indoor)
+    if processes is None:
+        processes = parse_processes
 
-        if cvs_reader is None:
-            continue
+    with contextlib.ExitStack() as stack:
+        if process_executor is None and processes > 0:
+            process_executor = stack.enter_context(ProcessPoolExecutor(max_workers=processes))
 
-        value_names = {}
+        # w=g*p
+        for i, columns in enumerate(load_csv_dumps(dr, sensor_type, sensor_id, indoor, workers, process_executor,
+                                                   cancel, sensor.failed_dates)):
+            if callback is not None:
+                callback(percentage(drl, i), drl, i)
 
-        for cvs_i, row in enumerate(cvs_reader):
-            if cvs_i == 0:
-                values = row[0].split(";")
-                for vi, v in enumerate(values):
-                    value_names[vi] = v
-            else:
-                vi = 0
-                splitted = row[0].split(";")
-
-                sensor.type = splitted[1]
-                sensor.lat = float(splitted[3])
-                sensor.lon = float(splitted[4])
-                for vi, value in enumerate(splitted):
-                    if vi >= 6:
-                        data_list.append(
-                            SensorData(datetime.datetime.strptime(splitted[5], date_format), value, value_names[vi],
-                                       sensor_id))
-    sensor.sensor_data = data_list
+            if columns is not None:
+                _apply_columns(sensor, columns)
+                days.append(columns)
+    sensor.sensor_data = _build_series(sensor_id, days)
 
     if callback is not None:
         callback(1, drl, i)
     return sensor
 
 
+def _decompress_gzip_chunk(decompressor, chunk: bytes):
+    """
+    Entpackt ein Stück eines gepackten Archivs, das aus mehreren aneinandergehängten gzip-Membern bestehen kann
+    (z. B. nach einer Range-Anfrage, siehe revalidate_archive). Endet ein Member im Stück,
+    wird für den Rest ein neuer Decompressor begonnen.
+    Gibt die entpackten Bytes und den Decompressor für das nächste Stück zurück.
+    """
+    output = []
+    while True:
+        output.append(decompressor.decompress(chunk))
+        if not decompressor.eof or decompressor.unused_data == b"":
+            break
+        chunk = decompressor.unused_data
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    return b"".join(output), decompressor
+
+
+async def read_csv_dump_async(session, date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                              semaphore: asyncio.Semaphore | None = None, cache: bool | None = None) -> list[str] | None:
+    """
+    Lädt eine CSV-Datei aus dem Cache-Ordner oder über die übergebene aiohttp.ClientSession vom Server herunter
+    und gibt ihre Zeilen zurück. Das Archiv wird beim Empfangen entpackt,
+    im Cache-Ordner wird höchstens die gepackte Datei abgelegt (siehe cache_archives).
+    Mit dem optionalen Semaphor wird die Anzahl gleichzeitiger Downloads begrenzt.
+    Archive der letzten Tage werden vorher in einem Thread mit revalidate_archive geprüft.
+    Existiert die Datei auf dem Server nicht (404), wird None zurückgegeben,
+    bei anderen Fehlern des Servers wird aiohttp.ClientResponseError ausgelöst.
+    Endet das Archiv vor dem Ende seines letzten gzip-Members, wird wie bei gzip ein EOFError ausgelöst
+    und nichts im Cache-Ordner abgelegt.
+    """
+    import asyncio
+
+    if cache is None:
+        cache = cache_archives
+
+    filename = get_cache_filename(date, sensor_type, sensor_id, indoor)
+    gz_filename = filename + ".gz"
+
+    if needs_revalidation(date) and Path(gz_filename).exists():
+        async with semaphore if semaphore is not None else contextlib.nullcontext():
+            await asyncio.to_thread(revalidate_archive, date, sensor_type, sensor_id, indoor)
+
+    cached = _open_cached_csv_dump(filename)
+    if cached is not None:
+        with cached as file:
+            return file.read().splitlines()
+
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    async with semaphore if semaphore is not None else contextlib.nullcontext():
+        async with session.get(url) as response:
+            if not response.ok:
+                print(f"Error while downloading '{url}'")
+                if response.status == 404:
+                    return None
+                response.raise_for_status()
+            print(f"Downloading '{url}'...")
+
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            lines: list[str] = []
+            pending = ""
+            cache_file = open(gz_filename + ".part", 'wb') if cache else None
+            try:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    if cache_file is not None:
+                        cache_file.write(chunk)
+                    data, decompressor = _decompress_gzip_chunk(decompressor, chunk)
+                    lines_chunk = (pending + decoder.decode(data)).split("\n")
+                    pending = lines_chunk.pop()
+                    lines.extend(lines_chunk)
+                pending += decoder.decode(decompressor.flush(), final=True)
+                if not decompressor.eof:
+                    raise EOFError(f"Compressed file '{url}' ended before the end-of-stream marker was reached")
+            except BaseException:
+                if cache_file is not None:
+                    cache_file.close()
+                    os.remove(cache_file.name)
+                raise
+
+    if pending != "":
+        lines.append(pending)
+    if cache_file is not None:
+        cache_file.close()
+        os.replace(cache_file.name, gz_filename)
+        _store_validators(gz_filename, response.headers)
+        sensor_cache.add(gz_filename)
+
+    return lines
+
+
+async def _fetch_csv_dump_async(session, date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                                semaphore: asyncio.Semaphore | None = None) -> tuple[bytes, object] | None:
+    """
+    Asynchrones Gegenstück zu fetch_csv_dump für die Verarbeitung in einem Prozess-Pool:
+    Gibt den unverarbeiteten, vom Server also noch gepackten Inhalt zusammen mit den Headern der Antwort zurück,
+    aus dem Cache-Ordner ohne Header (None). Abgelegt wird das Archiv erst, wenn es verarbeitet werden konnte,
+    damit ein unvollständiges Archiv nicht im Cache landet.
+    Existiert die Datei auf dem Server nicht (404), wird None zurückgegeben.
+    """
+    import asyncio
+
+    filename = get_cache_filename(date, sensor_type, sensor_id, indoor)
+    gz_filename = filename + ".gz"
+
+    if needs_revalidation(date) and Path(gz_filename).exists():
+        async with semaphore if semaphore is not None else contextlib.nullcontext():
+            await asyncio.to_thread(revalidate_archive, date, sensor_type, sensor_id, indoor)
+
+    if Path(filename).exists():
+        with open(filename, 'rb') as file:
+            return file.read(), None
+    if sensor_cache.lookup(gz_filename):
+        try:
+            with open(gz_filename, 'rb') as file:
+                return file.read(), None
+        except FileNotFoundError:
+            sensor_cache.discard(gz_filename)
+
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    async with semaphore if semaphore is not None else contextlib.nullcontext():
+        async with session.get(url) as response:
+            if not response.ok:
+                print(f"Error while downloading '{url}'")
+                if response.status == 404:
+                    return None
+                response.raise_for_status()
+            print(f"Downloading '{url}'...")
+            return await response.read(), response.headers
+
+
+async def get_csv_dump_async(session, date: datetime.date, sensor_type: str, sensor_id: int, indoor: int,
+                             semaphore: asyncio.Semaphore | None = None, cache: bool | None = None):
+    """
+    Asynchrones Gegenstück zu get_csv_dump.
+    Gibt den Inhalt der mit read_csv_dump_async geladenen CSV-Datei als csv.reader zurück
+    oder None, wenn die Datei auf dem Server nicht existiert.
+    """
+    lines = await read_csv_dump_async(session, date, sensor_type, sensor_id, indoor, semaphore, cache)
+    if lines is None:
+        return None
+    return csv.reader(lines, dialect='excel')
+
+
+async def load_sensor_data_async(year: int, sensor_type: str, sensor_id: int, indoor: int, callback=None,
+                                 session=None, semaphore: asyncio.Semaphore | None = None,
+                                 process_executor: ProcessPoolExecutor | None = None,
+                                 dates: list[datetime.datetime] | None = None) -> Sensor:
+    """
+    Asynchrones Gegenstück zu load_sensor_data.
+    Die CSV-Dateien werden über eine aiohttp.ClientSession gleichzeitig heruntergeladen und jeweils verarbeitet,
+    sobald sie angekommen sind. Die Werte werden dennoch in der Reihenfolge des Datums abgelegt.
+    Über session und semaphore können mehrere Sensoren in einer Event-Loop eine Session und ein Download-Limit
+    teilen, ansonsten wird eine eigene Session mit download_workers gleichzeitigen Downloads verwendet.
+    Mit einem process_executor werden die Dateien in dessen Prozessen verarbeitet, ohne die Event-Loop zu blockieren.
+    Ist dates angegeben (z. B. von plan_sync), werden nur diese Tage geladen.
+    Tage, die nicht geladen werden konnten, stehen wie bei load_sensor_data in failed_dates des Sensors.
+    Ein Fortschritts-Callback kann optional angegeben werden.
+    """
+    import asyncio
+    import aiohttp
+
+    dr = get_date_range_year(year) if dates is None else dates
+    drl = len(dr)
+    done = 0
+
+    days: list[SensorColumns | None] = [None for _ in dr]
+    sensor = Sensor(sensor_id, "type", 0, 0, indoor, load_data=False)
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(download_workers, 1))
+
+    async def load_day(day_i: int, d: datetime.date):
+        nonlocal done
+        try:
+            if process_executor is None:
+                lines = await read_csv_dump_async(session, d, sensor_type, sensor_id, indoor, semaphore)
+                if lines is not None:
+                    days[day_i] = parse_csv_columns(lines)
+            else:
+                # Die gepackten Bytes sind deutlich kleiner als die entpackten Zeilen und daher schneller übertragen
+                fetched = await _fetch_csv_dump_async(session, d, sensor_type, sensor_id, indoor, semaphore)
+                if fetched is not None:
+                    content, headers = fetched
+                    days[day_i] = await asyncio.get_running_loop().run_in_executor(process_executor,
+                                                                                   parse_csv_archive, content)
+                    if headers is not None and cache_archives:
+                        _write_cached_archive(get_cache_filename(d, sensor_type, sensor_id, indoor) + ".gz",
+                                              content, headers)
+        except (aiohttp.ClientError, *_download_errors) as e:
+            print(f"Error while loading {d}: {e}")
+            sensor.failed_dates.append(d)
+        done += 1
+        if callback is not None:
+            callback(percentage(drl, done), drl, done)
+
+    async with contextlib.AsyncExitStack() as stack:
+        if session is None:
+            session = await stack.enter_async_context(aiohttp.ClientSession())
+        await asyncio.gather(*(load_day(day_i, d) for day_i, d in enumerate(dr)))
+
+    for columns in days:
+        if columns is not None:
+            _apply_columns(sensor, columns)
+    sensor.sensor_data = _build_series(sensor_id, days)
+    sensor.failed_dates.sort()
+
+    if callback is not None:
+        callback(1, drl, done)
+    return sensor
+
+
+def get_sync_watermark(sensor_id: int, year: int) -> datetime.date | None:
+    """
+    Gibt den letzten Tag des Jahres zurück, bis zu dem der Sensor vollständig synchronisiert wurde,
+    oder None, wenn das Jahr noch nicht synchronisiert wurde.
+    """
+    res = get_connection().execute("SELECT synced_until FROM sync_state WHERE sensor_id=? AND year=?",
+                                   (sensor_id, year)).fetchone()
+    if res is None:
+        return None
+    return datetime.date.fromisoformat(res[0])
+
+
+def mark_synced(sensor_id: int, year: int, failed_dates: list[datetime.date] | None = None):
+    """
+    Speichert nach einer Synchronisation den Tag, bis zu dem das Jahr nicht erneut geladen werden muss.
+    Das ist der letzte Tag, für den Werte in der Datenbank liegen, sodass Tage danach, deren Archiv
+    noch fehlte, bei der nächsten Synchronisation erneut geladen werden.
+    Tage, die nicht geladen werden konnten (failed_dates, siehe load_sensor_data), liegen immer nach dem Stand.
+    Der Stand bleibt außerdem mehr als cache_revalidate_days Tage hinter dem heutigen Tag,
+    da sich jüngere Archive auf dem Server noch ändern können (siehe needs_revalidation).
+    """
+    days_with_data = get_days_with_data(sensor_id, year)
+    if len(days_with_data) == 0:
+        return
+    recent_days = cache_revalidate_days if cache_revalidate_days is not None else 0
+    synced_until = min(max(days_with_data), datetime.date(year, 12, 31),
+                       datetime.date.today() - datetime.timedelta(days=recent_days + 1))
+    if failed_dates:
+        first_failed = min(d.date() if isinstance(d, datetime.datetime) else d for d in failed_dates)
+        synced_until = min(synced_until, first_failed - datetime.timedelta(days=1))
+    if synced_until < datetime.date(year, 1, 1):
+        return
+    with write_transaction() as connection:
+        connection.execute("INSERT OR REPLACE INTO sync_state(sensor_id, year, synced_until) VALUES (?, ?, ?)",
+                           (sensor_id, year, synced_until.isoformat()))
+
+
+def get_days_with_data(sensor_id: int, year: int) -> set[datetime.date]:
+    """
+    Gibt alle Tage des Jahres zurück, für die in der Datenbank Werte des Sensors vorhanden sind.
+    """
+    res = get_connection().execute("SELECT DISTINCT bucket FROM rollup_day WHERE sensor_id=? AND bucket BETWEEN ? AND ?",
+                                   (sensor_id, f"{year:04d}-01-01", f"{year:04d}-12-31")).fetchall()
+    return {datetime.date.fromisoformat(row[0]) for row in res}
+
+
+def plan_sync(sensor_id: int, year: int) -> list[datetime.datetime]:
+    """
+    Gibt die Tage des Jahres zurück, die bei einer Synchronisation geladen werden müssen.
+    Tage bis zum gespeicherten Stand (siehe mark_synced) sowie Tage, für die bereits Werte in der Datenbank liegen,
+    werden übersprungen. Ohne gespeicherten Stand wird der letzte Tag mit Werten dennoch geladen,
+    da er beim Laden möglicherweise noch unvollständig war.
+    Der heutige Tag und Tage, deren Archiv sich noch ändern kann (siehe needs_revalidation), werden immer geladen.
+    """
+    today = datetime.date.today()
+    watermark = get_sync_watermark(sensor_id, year)
+    days_with_data = get_days_with_data(sensor_id, year)
+    if watermark is None and len(days_with_data) > 0:
+        days_with_data.remove(max(days_with_data))
+
+    planned = []
+    for d in get_date_range_year(year):
+        day = d.date()
+        if day >= today or needs_revalidation(day):
+            planned.append(d)
+        elif watermark is not None and day <= watermark:
+            continue
+        elif day not in days_with_data:
+            planned.append(d)
+    return planned
+
+
 def delete_from_database(sensor_id: int):
     print(f"Deleting '{sensor_id}' from database...")
     int(sensor_id)
-    database_connection.execute(f"DELETE FROM data WHERE sensor_id=?", [sensor_id])
-    database_connection.execute(f"DELETE FROM sensor WHERE id=?", [sensor_id])
-    database_connection.commit()
+    with write_transaction() as connection:
+        connection.execute(f"DELETE FROM data WHERE sensor_id=?", [sensor_id])
+        delete_rollups(sensor_id)
+        connection.execute(f"DELETE FROM sync_state WHERE sensor_id=?", [sensor_id])
+        connection.execute(f"DELETE FROM sensor WHERE id=?", [sensor_id])
     print(f"Deleted '{sensor_id}' from database.")
 
 
@@ -478,7 +2069,7 @@ def is_indoor(sensor_id: int) -> int | None:
     wenn die Sensor-ID in der Datenbank nicht gefunden wurde oder es ein Problem mit der Datenbankverbindung gibt.
     """
     int(sensor_id)
-    res = database_connection.execute(f"SELECT indoor FROM sensor_type WHERE sensor_id=?", [sensor_id]).fetchone()
+    res = get_connection().execute(f"SELECT indoor FROM sensor_type WHERE sensor_id=?", [sensor_id]).fetchone()
     if res is None:
         return None
     elif res[0] == 1:
@@ -488,38 +2079,101 @@ def is_indoor(sensor_id: int) -> int | None:
     return None
 
 
-def find_sensor_type(sensor_id: int, year: int, indoor: int) -> str | None:
+def probe_archive(date: datetime.date, sensor_type: str, sensor_id: int, indoor: int) -> bool | None:
+    """
+    Prüft, ob für den Tag ein Archiv des Sensors existiert, ohne es herunterzuladen.
+    Liegt es nicht im Cache-Ordner, wird nur eine HEAD-Anfrage an den Server gestellt.
+    Gibt None zurück, wenn der Server nicht erreichbar war.
+    """
+    if Path(get_cache_filename(date, sensor_type, sensor_id, indoor) + ".gz").exists():
+        return True
+    url = get_archive_url(date, sensor_type, sensor_id, indoor)
+    try:
+        response = get_http_session().head(url, timeout=sensor_search_probe_timeout)
+    except requests.RequestException:
+        return None
+    return response.ok
+
+
+def _sample_dates(dates: list[datetime.datetime], count: int) -> list[datetime.datetime]:
+    """
+    Wählt bis zu count gleichmäßig verteilte Tage aus, beginnend mit dem jüngsten.
+    """
+    if len(dates) <= count:
+        return dates[::-1]
+    step = (len(dates) - 1) / (count - 1) if count > 1 else 0
+    return [dates[len(dates) - 1 - round(i * step)] for i in range(count)]
+
+
+def find_sensor_type(sensor_id: int, year: int, indoor: int, cancel: CancellationToken | None = None) -> str | None:
     """
     Sucht den Typ eines Sensors anhand seiner ID, Jahres und Innen- / Außenanwendung.
     Falls der Typ in der Datenbank existiert, wird dieser zurückgegeben.
-    Ansonsten wird für das angegebene Jahr nach passenden Sensor-Typen gesucht,
-    indem CSV-Dateien ausgelesen und auf den Sensor hin geprüft werden.
+    Ansonsten wird an einigen über das Jahr verteilten Tagen (siehe sensor_search_samples) gleichzeitig
+    für alle bekannten Sensor-Typen per probe_archive geprüft, ob ein Archiv des Sensors existiert.
+    Häufige Typen werden zuerst geprüft.
     Wird ein passender Typ gefunden, wird dieser in die Datenbank eingetragen und zurückgegeben.
-    Andernfalls wird None zurückgegeben.
+    Andernfalls wird None zurückgegeben und das Ergebnis für sensor_search_negative_ttl gespeichert.
+    Wird das optionale CancellationToken abgebrochen, werden ausstehende Prüfungen verworfen
+    und SyncCancelled ausgelöst, ohne auf laufende Anfragen zu warten.
     """
 
     int(year)
     int(sensor_id)
     int(indoor)
 
-    res = database_connection.execute(f"SELECT sensor_type FROM sensor_type WHERE sensor_id=?", [sensor_id]).fetchone()
+    res = get_connection().execute(f"SELECT sensor_type FROM sensor_type WHERE sensor_id=?", [sensor_id]).fetchone()
     if res is not None:
         return res[0]
 
-    dr = get_date_range_year(year)
-    types = database_connection.execute("SELECT type FROM sensor_search_types").fetchall()
-
-    for d in dr:
-        for typ in types:
-            cvs_reader = get_csv_dump(d, typ[0], sensor_id, indoor)
-            if cvs_reader is not None:
-                typ_name = typ[0].lower()
-                database_connection.execute("INSERT OR IGNORE INTO sensor_type(sensor_id, sensor_type, indoor) VALUES "
-                                            "(?, ?, ?)",
-                                            (sensor_id, typ_name, indoor))
-                database_connection.commit()
-                return typ[0]
-    return None
+    res = get_connection().execute("SELECT checked FROM sensor_search_misses WHERE sensor_id=? AND year=? AND indoor=?",
+                                   (sensor_id, year, indoor)).fetchone()
+    if res is not None and datetime.datetime.now() - datetime.datetime.fromisoformat(res[0]) < sensor_search_negative_ttl:
+        print(f"Sensor type of '{sensor_id}' was not found recently, skipping search.")
+        return None
+
+    dates = _sample_dates(get_date_range_year(year), sensor_search_samples)
+    types = [row[0] for row in get_connection().execute(
+        "SELECT type FROM sensor_search_types ORDER BY "
+        "(SELECT COUNT(*) FROM sensor_type WHERE sensor_type.sensor_type=sensor_search_types.type) DESC, type").fetchall()]
+
+    found = None
+    failed = False
+    # Wird beim Abbrechen erfüllt, damit das Warten auf die nächste Prüfung sofort endet
+    stop = Future()
+    executor = ThreadPoolExecutor(max_workers=max(download_workers, 1))
+    try:
+        futures = {executor.submit(probe_archive, d, typ, sensor_id, indoor): typ for d in dates for typ in types}
+        pending = set(futures)
+        with _registered(cancel, lambda: stop.set_result(None)):
+            while len(pending) > 0 and found is None:
+                done, pending = wait(pending | {stop}, return_when=FIRST_COMPLETED)
+                pending.discard(stop)
+                _check_cancel(cancel)
+                for future in done:
+                    result = future.result()
+                    if result is None:
+                        failed = True
+                    elif result:
+                        found = futures[future]
+                        break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if found is None:
+        if not failed:
+            with write_transaction() as connection:
+                connection.execute("INSERT OR REPLACE INTO sensor_search_misses(sensor_id, year, indoor, checked) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   (sensor_id, year, indoor, datetime.datetime.now().isoformat()))
+        return None
+
+    with write_transaction() as connection:
+        connection.execute("INSERT OR IGNORE INTO sensor_type(sensor_id, sensor_type, indoor) VALUES "
+                           "(?, ?, ?)",
+                           (sensor_id, found.lower(), indoor))
+        connection.execute("DELETE FROM sensor_search_misses WHERE sensor_id=?", [sensor_id])
+    return found
 
 
 def check_connection(timeout: int) -> True:
@@ -530,18 +2184,226 @@ def check_connection(timeout: int) -> True:
         return False
 
 
+def load_settings() -> dict[str, str]:
+    """
+    Liest die Einstellungen einmalig aus der Tabelle gui_settings und hält sie im Speicher.
+    """
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = {name.lower(): value for name, value in
+                         get_connection().execute("SELECT name, value FROM gui_settings").fetchall()}
+        return _settings
+
+
 def get_setting(name: str):
-    return database_connection.execute("SELECT value FROM gui_settings WHERE lower(name)=?", [name.lower()]).fetchone()[
-        0]
+    """
+    Gibt den Wert einer Einstellung aus dem Speicher zurück, ohne die Datenbank abzufragen (siehe load_settings).
+    """
+    settings = _settings if _settings is not None else load_settings()
+    return settings[name.lower()]
 
 
 def set_setting(name: str, value: str):
-    database_connection.execute("UPDATE gui_settings SET value=? WHERE name=?", (value, name.lower()))
-    database_connection.commit()
+    """
+    Speichert eine Einstellung in der Datenbank und im Speicher.
+    Hat sich der Wert geändert, werden alle mit add_setting_listener registrierten Funktionen
+    mit Name und neuem Wert aufgerufen.
+    """
+    name = name.lower()
+    settings = load_settings()
+    with write_transaction() as connection:
+        connection.execute("INSERT INTO gui_settings(name, value) VALUES (?, ?) "
+                           "ON CONFLICT(name) DO UPDATE SET value=excluded.value", (name, value))
+    with _settings_lock:
+        changed = settings.get(name) != value
+        settings[name] = value
+    if changed:
+        for listener in list(_setting_listeners):
+            listener(name, value)
+
+
+def add_setting_listener(listener):
+    """
+    Registriert eine Funktion listener(name, value), die bei jeder Änderung einer Einstellung aufgerufen wird.
+    """
+    _setting_listeners.append(listener)
 
 
-create_tables()
+def remove_setting_listener(listener):
+    """
+    Entfernt eine mit add_setting_listener registrierte Funktion.
+    """
+    if listener in _setting_listeners:
+        _setting_listeners.remove(listener)
+
+
+class _ReadHandle:
+    """
+    Lese-Verbindung eines Threads. Wird der Thread beendet, geht die Verbindung an den Pool zurück.
+    """
+    __slots__ = ("manager", "connection")
+
+    def __init__(self, manager: ConnectionManager, connection: sqlite3.Connection):
+        super().__init__()
+        self.manager = manager
+        self.connection = connection
+
+    def __del__(self):
+        self.manager.release_reader(self.connection)
 
-load_sensor_cache()
-thread = threading.Thread(target=import_sensor_types)
-thread.start()
+
+class ConnectionManager:
+    """
+    Verwaltet die Verbindungen zur Datenbank. Die Datenbank läuft im WAL-Modus,
+    sodass Lesezugriffe nie auf einen laufenden Schreibvorgang (z. B. beim Speichern eines Sensors) warten.
+    Geschrieben wird nur über eine Verbindung, die mit write() für jeweils einen Thread gesperrt wird.
+    Zum Lesen erhält jeder Thread mit read() eine eigene schreibgeschützte Verbindung aus einem Pool.
+    Hält ein Thread die Schreibverbindung, liest er über diese, damit er seine eigenen Änderungen sieht.
+    """
+
+    def __init__(self, path: str, max_idle_readers: int = 4):
+        super().__init__()
+        self.path = path
+        self.max_idle_readers = max_idle_readers
+        self.writer = sqlite3.connect(path, check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.write_lock = threading.RLock()
+        self.write_depth = 0
+        self.write_owner: int | None = None
+        self.local = threading.local()
+        self.idle_readers: list[sqlite3.Connection] = []
+        self.pool_lock = threading.Lock()
+        self.closed = False
+
+    def _open_reader(self) -> sqlite3.Connection:
+        with self.pool_lock:
+            if len(self.idle_readers) > 0:
+                return self.idle_readers.pop()
+        return sqlite3.connect(Path(self.path).absolute().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+
+    def release_reader(self, connection: sqlite3.Connection):
+        """
+        Gibt eine Lese-Verbindung an den Pool zurück oder schließt sie, wenn der Pool voll ist.
+        """
+        with self.pool_lock:
+            if not self.closed and len(self.idle_readers) < self.max_idle_readers:
+                self.idle_readers.append(connection)
+                return
+        connection.close()
+
+    def read(self) -> sqlite3.Connection:
+        """
+        Gibt die Lese-Verbindung des aktuellen Threads zurück
+        oder die Schreibverbindung, wenn der Thread gerade in write() schreibt.
+        """
+        if self.write_owner == threading.get_ident():
+            return self.writer
+        handle = getattr(self.local, "handle", None)
+        if handle is None:
+            handle = _ReadHandle(self, self._open_reader())
+            self.local.handle = handle
+        return handle.connection
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Sperrt die Schreibverbindung für den aktuellen Thread und gibt sie zurück.
+        Blöcke können verschachtelt werden. Am Ende des äußersten Blocks wird die Transaktion bestätigt,
+        bei einem Fehler zurückgerollt.
+        """
+        with self.write_lock:
+            self.write_depth += 1
+            self.write_owner = threading.get_ident()
+            try:
+                yield self.writer
+            except BaseException:
+                if self.write_depth == 1 and self.writer.in_transaction:
+                    self.writer.rollback()
+                raise
+            else:
+                if self.write_depth == 1 and self.writer.in_transaction:
+                    self.writer.commit()
+            finally:
+                self.write_depth -= 1
+                if self.write_depth == 0:
+                    self.write_owner = None
+
+    def close(self):
+        """
+        Schließt die Schreibverbindung und alle Lese-Verbindungen im Pool.
+        Lese-Verbindungen, die noch von Threads gehalten werden, werden bei deren Rückgabe geschlossen.
+        """
+        with self.write_lock:
+            self.writer.close()
+        with self.pool_lock:
+            self.closed = True
+            for connection in self.idle_readers:
+                connection.close()
+            self.idle_readers.clear()
+
+
+def init(db_path: str | None = None, cache_dir: str | None = None, import_types: bool = True):
+    """
+    Bereitet das Modul vor: Erstellt den Cache-Ordner, öffnet die Datenbank (siehe ConnectionManager)
+    und legt die Tabellen an, packt ältere CSV-Dateien im Cache und füllt den Sensor-Cache.
+    Mit import_types werden die Sensor-Typen zusätzlich in einem eigenen Thread importiert (siehe import_sensor_types).
+    Ohne db_path liegt die Datenbank als "database.db" im Cache-Ordner.
+    Der Import des Moduls selbst hat keine Nebenwirkungen. Wird init nicht aufgerufen,
+    geschieht dies beim ersten Zugriff auf Datenbank oder Cache mit den Standardpfaden und ohne Import der Sensor-Typen.
+    Ein erneuter Aufruf schließt die bisherigen Datenbankverbindungen.
+    """
+    global cache_path, database_path, database, import_thread, _settings
+    with _init_lock:
+        if cache_dir is not None:
+            cache_path = cache_dir
+            database_path = os.path.join(cache_dir, "database.db")
+        if db_path is not None:
+            database_path = db_path
+
+        create_cache_dir()
+        sensor_cache.set_path(os.path.join(cache_path, "sensors"))
+        sensor_cache.max_bytes = cache_max_bytes
+        if database is not None:
+            database.close()
+        database = ConnectionManager(database_path, database_idle_readers)
+        _settings = None
+
+        create_tables()
+        compress_cache()
+        load_sensor_cache()
+
+    if import_types:
+        import_thread = threading.Thread(target=import_sensor_types)
+        import_thread.start()
+
+
+def _require_init():
+    if database is None:
+        with _init_lock:
+            if database is None:
+                init(import_types=False)
+
+
+def get_database() -> ConnectionManager:
+    """
+    Gibt die Verwaltung der Datenbankverbindungen zurück und initialisiert das Modul beim ersten Zugriff (siehe init).
+    """
+    _require_init()
+    return database
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Gibt die Verbindung zum Lesen für den aktuellen Thread zurück (siehe ConnectionManager.read).
+    Innerhalb von write_transaction ist das die Schreibverbindung.
+    """
+    return get_database().read()
+
+
+def write_transaction():
+    """
+    Kontextmanager, der die Schreibverbindung sperrt und zurückgibt (siehe ConnectionManager.write).
+    """
+    return get_database().write()
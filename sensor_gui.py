@@ -2,14 +2,17 @@ from __future__ import annotations
 
 import datetime
 import enum
+import queue
 import threading
-import time
 import tkinter as tk
+import traceback
 import tkinter.ttk as ttk
 
 import matplotlib
+import matplotlib.dates
 from pathlib import Path
 
+import numpy as np
 import requests
 from PIL import Image, ImageTk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
@@ -21,20 +24,88 @@ from sensor_data import Sensor
 
 empty_cache = 0
 
-sensor_search_timeout = 60
+sensor_search_timeout = 15
 sensor_thread_timeout = 5
 
-# Erstellt ein Fenster mit einer MessageBox
+# Abstand in Millisekunden, in dem die GUI die Ereignisse aus den Hintergrund-Threads abarbeitet.
+# Fortschrittsanzeigen werden dadurch höchstens so oft neu gezeichnet
+event_poll_interval = 50
+
+# Anzahl der Abschnitte je Pixel Breite eines Graphen, auf die die Linien verkleinert werden.
+# Je Abschnitt werden Minimum und Maximum gezeichnet (siehe sensor_data.decimate_min_max)
+plot_buckets_per_pixel = 1
+
+
+# Nimmt Ereignisse aus Hintergrund-Threads entgegen und führt sie im Thread der GUI aus,
+# der die Warteschlange mit after() regelmäßig abarbeitet.
+# Fortschrittsmeldungen werden je Anzeige zusammengefasst, sodass nur die letzte gezeichnet wird.
+class GuiEvents:
+    def __init__(self, master: tk.Misc):
+        self.master = master
+        self.queue = queue.SimpleQueue()
+        self.progress_lock = threading.Lock()
+        self.pending_progress: dict[SensorDownloader, tuple] = {}
+        self.master.after(event_poll_interval, self._drain)
+
+    # Führt function(*args, **kwargs) im Thread der GUI aus
+    def call(self, function, *args, **kwargs):
+        self.queue.put((function, args, kwargs))
+
+    # Merkt sich den Fortschritt einer Anzeige, ältere noch nicht gezeichnete Werte werden verworfen
+    def progress(self, downloader: SensorDownloader, *args):
+        with self.progress_lock:
+            self.pending_progress[downloader] = args
+
+    # Arbeitet die Warteschlange ab. Ein Fehler in einem Ereignis wird ausgegeben,
+    # ohne die Abarbeitung der übrigen und aller späteren Ereignisse zu beenden
+    def _drain(self):
+        try:
+            with self.progress_lock:
+                pending_progress = self.pending_progress
+                self.pending_progress = {}
+            for downloader, args in pending_progress.items():
+                self.__run(downloader.show_progress, args, {})
+
+            while True:
+                try:
+                    function, args, kwargs = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.__run(function, args, kwargs)
+        finally:
+            self.master.after(event_poll_interval, self._drain)
+
+    @staticmethod
+    def __run(function, args, kwargs):
+        try:
+            function(*args, **kwargs)
+        except Exception:
+            print(f"Error in GUI event {getattr(function, '__qualname__', function)}:")
+            traceback.print_exc()
+
+
+gui_events: GuiEvents | None = None
+
+
+# Erstellt ein Fenster mit einer MessageBox.
+# Aus Hintergrund-Threads wird sie über gui_events im Thread der GUI angezeigt.
 def message_box(title: str, text: str, style: int):
-    root = tk.Tk()
-    root.withdraw()  # Hide the root window
+    if gui_events is not None and threading.current_thread() is not threading.main_thread():
+        gui_events.call(message_box, title, text, style)
+        return
+
+    temp_root = None
+    if gui_events is None:
+        temp_root = tk.Tk()
+        temp_root.withdraw()  # Hide the root window
     if style == 0:  # Information
         messagebox.showinfo(title, text)
     elif style == 1:  # Warning
         messagebox.showwarning(title, text)
     elif style == 2:  # Error
         messagebox.showerror(title, text)
-    root.destroy()
+    if temp_root is not None:
+        temp_root.destroy()
 
 
 # Repräsentiert den Status des Download-prozesses
@@ -134,34 +205,41 @@ class SensorDownloader(tk.Frame):
     def cancel_callback(self):
         self.cancel_download()
 
+    # Bricht den laufenden Download über das CancellationToken ab.
+    # Der Download-Thread beendet sich daraufhin selbst, schließt die Anzeige und meldet den Abbruch.
     def cancel_download(self):
-        if self.sensor_selector.downloading.value.numerator == 1 or self.sensor_selector.downloading.value.numerator == 2:
-            self.sensor_selector.check_thread.join(timeout=0)
-            self.sensor_selector.download_thread.join(timeout=0)
-            self.sensor_selector.downloading = DownloadState.NONE
-            self.finished()
-            message_box("Download", "Download wurde erfolgreich abgebrochen", 0)
+        cancel_token = self.sensor_selector.cancel_token
+        if self.sensor_selector.downloading in (DownloadState.SEARCHING_TYPE, DownloadState.DOWNLOADING,
+                                                DownloadState.SAVING_IN_DATABASE) and cancel_token is not None:
+            cancel_token.cancel()
+            self.set_title("Breche Download ab...")
             pass
         else:
             message_box("Download", "Der download konnte nicht abgebrochen werden.", 0)
             pass
 
-    # Führt die Download-Anzeige aus
+    # Meldet den Fortschritt, kann aus jedem Thread aufgerufen werden.
+    # Gezeichnet wird gesammelt im Thread der GUI (siehe GuiEvents).
     def download(self, p: float, g: float, w: float, title=None):
+        gui_events.progress(self, p, g, w, title)
+
+    # Führt die Download-Anzeige aus
+    def show_progress(self, p: float, g: float, w: float, title=None):
         if title is None:
             self.title.configure(text=f"Herunterladen ({(int(p * 100))}%)...")
         else:
             self.title.configure(text=title)
 
-        self.title.update()
-
         self.progressbar.configure(maximum=g, value=w)
-        self.progressbar.update()
 
-    # Zerstört die Download-Anzeige
+    # Setzt den Titel der Anzeige, kann aus jedem Thread aufgerufen werden
+    def set_title(self, text: str):
+        gui_events.call(self.title.configure, text=text)
+
+    # Zerstört die Download-Anzeige, kann aus jedem Thread aufgerufen werden
     def finished(self):
-        self.pack_forget()
         self.sensor_selector.downloading = DownloadState.NONE
+        gui_events.call(self.pack_forget)
 
 
 class GraphToolbar(NavigationToolbar2Tk):
@@ -173,11 +251,85 @@ class GraphToolbar(NavigationToolbar2Tk):
         pass
 
 
-# Dieses Frame ist für die Darstellung der Daten zuständig
+# Hält die vollständigen Daten der Linien eines Graphen und zeichnet davon nur so viele Punkte,
+# wie der sichtbare Bereich in Pixeln breit ist.
+# Beim Zoomen und Verschieben über die GraphToolbar sowie bei Größenänderungen wird neu verkleinert.
+# Die Linien werden animiert gezeichnet: Nach jedem vollständigen Zeichnen wird der Hintergrund gespeichert,
+# sodass Änderungen, die nur die Linien betreffen, per Blitting ohne Neuzeichnen der Achsen erfolgen.
+class DecimatedPlot:
+    def __init__(self, axes: matplotlib.axes.Axes):
+        self.axes = axes
+        self.x_axis = np.empty(0)
+        self.lines = []
+        self.y_axes = []
+        self.background = None
+
+        canvas = axes.figure.canvas
+        axes.callbacks.connect("xlim_changed", lambda ax: self.decimate())
+        canvas.mpl_connect("resize_event", lambda event: self.decimate())
+        canvas.mpl_connect("draw_event", self.__drawn)
+
+    # Fügt eine zunächst leere Linie hinzu und gibt sie zurück
+    def add_line(self, **kw):
+        line, = self.axes.plot([], [], animated=True, **kw)
+        self.lines.append(line)
+        self.y_axes.append(np.empty(0))
+        return line
+
+    # Ersetzt die vollständigen Daten aller Linien, passt die Achsen daran an und zeichnet den Graphen neu
+    def set_data(self, x_axis: np.ndarray, y_axes: list[np.ndarray]):
+        self.x_axis = x_axis
+        self.y_axes = list(y_axes)
+        for line, y_axis in zip(self.lines, self.y_axes):
+            line.set_data(x_axis, y_axis)
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.decimate()
+        self.axes.figure.canvas.draw_idle()
+
+    # Verkleinert die Linien für den aktuell sichtbaren Bereich neu
+    def decimate(self):
+        if len(self.x_axis) == 0:
+            return
+        x_min, x_max = self.axes.get_xlim()
+        start = max(int(self.x_axis.searchsorted(x_min)) - 1, 0)
+        end = int(self.x_axis.searchsorted(x_max, side="right")) + 1
+        buckets = self.__buckets()
+        for line, y_axis in zip(self.lines, self.y_axes):
+            line.set_data(*sensor_data.decimate_min_max(self.x_axis[start:end], y_axis[start:end], buckets))
+
+    # Zeichnet nur die Linien auf dem gespeicherten Hintergrund neu.
+    # Wurde der Graph noch nicht vollständig gezeichnet, wird das Zeichnen stattdessen eingeplant
+    def redraw_lines(self):
+        canvas = self.axes.figure.canvas
+        if self.background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+        canvas.blit(self.axes.bbox)
+
+    def __drawn(self, event):
+        self.background = self.axes.figure.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def __buckets(self) -> int:
+        return max(int(self.axes.bbox.width * plot_buckets_per_pixel), 1)
+
+
+# Dieses Frame ist für die Darstellung der Daten zuständig.
+# Es bleibt für die gesamte Laufzeit bestehen: Figures, Canvases und Toolbars werden je Wertname einmal erstellt
+# und für jeden weiteren Sensor mit neuen Daten wiederverwendet.
 class SensorGraph(tk.Frame):
-    def __init__(self, sensor: Sensor, master=None, **kw):
+    def __init__(self, master=None, **kw):
         super(SensorGraph, self).__init__(master, **kw)
-        self.sensor: Sensor = sensor
+        self.sensor: Sensor | None = None
+        self.lines = []
+        self.canvases: list[FigureCanvasTkAgg] = []
+        self.toolbars: list[GraphToolbar] = []
+        self.plots: list[DecimatedPlot] = []
 
         self.graph_frame = tk.Frame(self)
         self.graph_frame.configure(height=100, width=300)
@@ -186,79 +338,110 @@ class SensorGraph(tk.Frame):
         self.configure(height=100, takefocus=True, width=300)
         self.place(anchor="nw", x=0, y=0)
 
-    # Zeigt die Daten eines Sensors aus einem Jahr
-    def show_data(self, loader: SensorDownloader):
+        sensor_data.add_setting_listener(self.setting_changed)
+
+    def destroy(self) -> None:
+        sensor_data.remove_setting_listener(self.setting_changed)
+        super().destroy()
+
+    # Wird bei jeder Änderung einer Einstellung aufgerufen.
+    # Ein neuer Linienstil wird direkt auf die vorhandenen Linien angewendet und per Blitting gezeichnet,
+    # bei einer neuen Sortierung werden die Daten neu zusammengefasst und in die vorhandenen Graphen übernommen.
+    def setting_changed(self, name: str, value: str):
+        if name == "linestyle":
+            for line in self.lines:
+                line.set_linestyle(value)
+            for plot in self.plots:
+                plot.redraw_lines()
+        elif name == "sql_date" and self.sensor is not None:
+            self.sensor.load_data()
+            self.show_data()
+
+    # Zeigt die Daten eines anderen Sensors in den vorhandenen Graphen
+    def show_sensor(self, sensor: Sensor, loader: SensorDownloader | None = None):
+        self.sensor = sensor
+        self.show_data(loader)
+
+    # Zeigt die Daten eines Sensors aus einem Jahr.
+    # Die Zeitachse ist numerisch (Tage im Format von matplotlib.dates), die Werte kommen spaltenweise
+    # aus aggregate_series des Sensors.
+    # Fehlende Graphen werden erstellt, nicht benötigte ausgeblendet.
+    def show_data(self, loader: SensorDownloader | None = None):
         print(f"Showing data for {self.sensor.id}...")
         i = 0
-        max_i = len(self.sensor.maximum.keys()) + len(self.sensor.minimum.keys()) + len(self.sensor.average.keys())
-        column = 0
-        row = 0
-        for i, key in enumerate(self.sensor.maximum.keys()):
-            loader.download(sensor_data.percentage(max_i, i), max_i, i, f"Lade Graf für Daten '{key}'...")
+        max_i = len(self.sensor.aggregate_series)
+        for i, (key, series) in enumerate(self.sensor.aggregate_series.items()):
+            if loader is not None:
+                loader.download(sensor_data.percentage(max_i, i), max_i, i, f"Lade Graf für Daten '{key}'...")
             y_label = key
 
-            x_axis = []
-            y_axis_min: list[float] = []
-            y_axis_max: list[float] = []
-            y_axis_avg: list[float] = []
-
             print(f"Plotting for {y_label}...")
 
-            sql_date_format = sensor_data.get_setting("sql_date")
+            x_axis = matplotlib.dates.date2num(series.timestamps.astype("datetime64[s]"))
 
-            for y_min in sorted(self.sensor.minimum[key]):
-                x_axis.append(y_min.timestamp.strftime(sql_date_format))
-                y_axis_min.append(float(y_min.value))
+            self._show_plot(i, x_axis, series.minimum, series.average, series.maximum, y_label)
 
-            for y_max in sorted(self.sensor.maximum[key]):
-                y_axis_max.append(float(y_max.value))
+        for j in range(max_i, len(self.plots)):
+            self.canvases[j].get_tk_widget().grid_remove()
+            self.toolbars[j].grid_remove()
 
-            for y_avg in sorted(self.sensor.average[key]):
-                y_axis_avg.append(float(y_avg.value))
+        if loader is not None and max_i > 0:
+            loader.download(sensor_data.percentage(max_i, i), max_i, i, f"Fertigstellen...")
+        pass
 
-            self._show_plot(x_axis, y_axis_min, y_axis_avg, y_axis_max, y_label, column, row)
-            if row == 2:
-                column += 1
-                row = 0
-            else:
-                row += 2
+    # Übernimmt die Daten in den Graphen an Position index und erstellt ihn, falls er noch nicht existiert.
+    # Die Linien werden dabei über DecimatedPlot verkleinert
+    def _show_plot(self, index: int, x_axis: np.ndarray, y_axis_min: np.ndarray, y_axis_avg: np.ndarray,
+                   y_axis_max: np.ndarray, y_label: str):
+        if index == len(self.plots):
+            self._create_plot()
 
-        loader.download(sensor_data.percentage(max_i, i), max_i, i, f"Fertigstellen...")
-        pass
+        plot = self.plots[index]
+        plot.axes.set_title(y_label)
+        plot.set_data(x_axis, [y_axis_max, y_axis_avg, y_axis_min])
 
-    # Erstellt den Graphen
-    def _show_plot(self, x_axis: list[float], y_axis_min: list[float], y_axis_avg: list[float], y_axis_max: list[float],
-                   y_label: str, column: int, row: int):
+        # Setzt den Verlauf der Toolbar zurück, damit "Home" die Ansicht des neuen Sensors zeigt
+        self.toolbars[index].update()
+
+        column = index // 2
+        row = (index % 2) * 2
+        self.canvases[index].get_tk_widget().grid(row=row, column=column)
+        self.toolbars[index].grid(row=row + 1, column=column)
+
+        print(f"Showed for {y_label}")
+
+    # Erstellt einen leeren Graphen mit Canvas und Toolbar
+    def _create_plot(self):
         fig = Figure(figsize=(5, 4), dpi=65)
 
         subplt: matplotlib.axes = fig.add_subplot(111)
+        locator = matplotlib.dates.AutoDateLocator()
+        subplt.xaxis.set_major_locator(locator)
+        subplt.xaxis.set_major_formatter(matplotlib.dates.ConciseDateFormatter(locator))
 
         line_style = sensor_data.get_setting("linestyle")
 
+        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
+        plot = DecimatedPlot(subplt)
+        self.plots.append(plot)
+
         # Max
-        subplt.plot(x_axis, y_axis_max, linestyle=line_style, color="red", label="max")
+        self.lines.append(plot.add_line(linestyle=line_style, color="red", label="max"))
         # Avg
-        subplt.plot(x_axis, y_axis_avg, linestyle=line_style, color="black", label="Ø")
+        self.lines.append(plot.add_line(linestyle=line_style, color="black", label="Ø"))
         # Min
-        subplt.plot(x_axis, y_axis_min, linestyle=line_style, color="green", label="min")
+        self.lines.append(plot.add_line(linestyle=line_style, color="green", label="min"))
 
         subplt.legend(loc="upper left")
 
         subplt.grid()
 
-        subplt.set_title(y_label)
-
         fig.add_gridspec(4, 4)
 
-        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-        canvas.draw()
-        canvas.get_tk_widget().grid(row=row, column=column)
+        self.canvases.append(canvas)
 
         toolbar = GraphToolbar(canvas, self.graph_frame, pack_toolbar=False)
-        toolbar.update()
-        toolbar.grid(row=row + 1, column=column)
-
-        print(f"Showed for {y_label}")
+        self.toolbars.append(toolbar)
 
 
 # Ist für die Auswahl der Sensoren zuständig
@@ -270,6 +453,8 @@ class SensorSelector(tk.Frame):
         self.downloading: DownloadState = DownloadState.NONE
         self.graph: SensorGraph | None = None
         self.download_thread: threading.Thread | None = None
+        self.cancel_token: sensor_data.CancellationToken | None = None
+        self.search_timed_out = False
 
         self.sensor_id_label = tk.Label(self)
         self.sensor_id_label.configure(anchor="center", text="Sensor ID*:")
@@ -403,35 +588,37 @@ class SensorSelector(tk.Frame):
             if not self.__check_id(id):
                 return
             self.downloading = DownloadState.LOADING_GRAPH
-            thread = threading.Thread(target=self.select_sensor, args=([id]))
+            loader = SensorDownloader(sensor_selector=self, master=root)
+            loader.pack(expand=True, fill="both")
+            loader.title.configure(text="Lade Sensor aus Datenbank...")
+
+            thread = threading.Thread(target=self.select_sensor, args=(id, loader))
             thread.start()
         except ValueError:
             message_box("Fehler", "Bitte wähle richtige Datentypen aus.", 0)
 
-    # Führt die Funktion show_graph aus,
+    # Lädt den Sensor im Hintergrund und führt danach im Thread der GUI die Funktion show_graph aus,
     # wenn der ausgewählte Sensor in der Datenbank existiert,
     # sowie wenn Daten aus dem jeweiligen Jahr existieren.
     # Wenn nicht, werden Fehlermeldungen in mit der message_box Funktion ausgegeben.
-    def select_sensor(self, id: int):
+    def select_sensor(self, id: int, loader: SensorDownloader):
         if sensor_data.exists_in_database(id):
-            self.__check_old_graph()
-            self.downloading = DownloadState.LOADING_GRAPH
-            loader = SensorDownloader(sensor_selector=self, master=root)
-            loader.pack(expand=True, fill="both")
-
-            loader.title.configure(text="Lade Sensor aus Datenbank...")
-            loader.title.update()
-
             sensor = sensor_data.get_sensor(id)
-            self.__check_indoor(sensor.indoor)
-
-            self.show_graph(sensor, loader)
-            loader.finished()
+            gui_events.call(self.__show_sensor, sensor, loader)
         else:
+            loader.finished()
             message_box("Fehler", "Dieser Sensor konnte nicht gefunden werden, bitte synchronisiere diesen erst.",
                         0)
             pass
-        self.downloading = DownloadState.NONE
+
+    def __show_sensor(self, sensor: sensor_data.Sensor, loader: SensorDownloader):
+        try:
+            self.__check_old_graph()
+            self.__check_indoor(sensor.indoor)
+
+            self.show_graph(sensor, loader)
+        finally:
+            loader.finished()
 
     # Wird ausgeführt, wenn der Anwender auf den Cache-Leeren-Button drückt.
     # Diese Funktion prüft, ob bereits ein Download stattfindet,
@@ -442,18 +629,21 @@ class SensorSelector(tk.Frame):
             already_downloading()
             return
         self.downloading = DownloadState.CLEARING_CACHE
-        thread = threading.Thread(target=self.clear_cache, args=())
+        thread = threading.Thread(target=self.clear_cache, args=(self.clear_all_checked.get(),))
         thread.start()
 
-    def clear_cache(self):
-        sensor_data.clear_cache(self.clear_all_checked.get())
-        if self.clear_all_checked.get():
+    def clear_cache(self, clear_all: bool):
+        sensor_data.clear_cache(clear_all)
+        gui_events.call(self.__cache_cleared, clear_all)
+        message_box("Cache", "Cache wurde erfolgreich gelöscht", 0)
+        self.downloading = DownloadState.NONE
+
+    def __cache_cleared(self, clear_all: bool):
+        if clear_all:
             self.sensor_id_cache.clear()
             self.sensor_id_cache.add(empty_cache)
             self.__reload_option_panel()
         self.__check_old_graph()
-        message_box("Cache", "Cache wurde erfolgreich gelöscht", 0)
-        self.downloading = DownloadState.NONE
 
     # Wird ausgeführt, wenn der Anwender auf den Cache-Leeren-Button drückt.
     # Erstellt einen neuen SensorDownloader, wenn kein Download stattfindet.
@@ -476,7 +666,12 @@ class SensorSelector(tk.Frame):
             downloader = SensorDownloader(self, root, show_cancel=True)
             downloader.pack(expand=True, fill="both")
 
-            self.check_thread = threading.Thread(target=self.start_download_check, args=(year, id, downloader))
+            typ = self.sensor_type_entry.get()
+            indoor = self.indoor_value.get()
+            self.cancel_token = sensor_data.CancellationToken()
+            self.search_timed_out = False
+            self.check_thread = threading.Thread(target=self.start_download_check,
+                                                 args=(year, id, typ, indoor, downloader, self.cancel_token))
             self.check_thread.start()
 
         except ValueError:
@@ -484,71 +679,117 @@ class SensorSelector(tk.Frame):
             message_box("Fehler", "Bitte wähle richtige Datentypen aus.", 0)
 
     # Startet den Download-Thread und den Checker
-    def start_download_check(self, year: int, id: int, downloader: SensorDownloader):
-        self.download_thread = threading.Thread(target=self.start_download, args=(year, id, downloader))
+    def start_download_check(self, year: int, id: int, typ: str, indoor: int, downloader: SensorDownloader,
+                             cancel: sensor_data.CancellationToken):
+        self.download_thread = threading.Thread(target=self.start_download,
+                                                args=(year, id, typ, indoor, downloader, cancel))
         self.download_thread.start()
-        self.__check_download(downloader)
+        self.__check_download(cancel)
+
+    # Startet den Download und fängt dessen Abbruch über das CancellationToken ab.
+    # Bis dahin gespeicherte Daten werden von save_in_database bereits zurückgerollt.
+    def start_download(self, year: int, id: int, typ: str, indoor: int, downloader: SensorDownloader,
+                       cancel: sensor_data.CancellationToken):
+        try:
+            self.__download(year, id, typ, indoor, downloader, cancel)
+        except sensor_data.SyncCancelled:
+            downloader.finished()
+            if self.search_timed_out:
+                message_box("Fehler", "Fehler beim laden des Sensortyps. Bitte gib den Typ manuell ein.", 0)
+            else:
+                message_box("Download", "Download wurde erfolgreich abgebrochen", 0)
 
-    # Startet den eigentlichen Download sowie die Speicherung der Daten.
+    # Führt den eigentlichen Download sowie die Speicherung der Daten aus.
+    # Läuft in einem Hintergrund-Thread, Änderungen an der GUI gehen daher über gui_events.
     # Nach der Fertigstellung des downloads wird das Option-Panel aktualisiert.
-    def start_download(self, year: int, id: int, downloader: SensorDownloader):
+    def __download(self, year: int, id: int, typ: str, indoor: int, downloader: SensorDownloader,
+                   cancel: sensor_data.CancellationToken):
 
-        downloader.title.configure(text="Prüfe Internetverbindung...")
+        downloader.set_title("Prüfe Internetverbindung...")
         if not sensor_data.check_connection(10):
             message_box("Fehler", "Es konnte keine Internetverbindung hergestellt werden.", 0)
             downloader.finished()
             self.downloading = DownloadState.NONE
             return
+        cancel.raise_if_cancelled()
+
+        downloader.set_title(f"Suche Sensortyp...")
+        stored_indoor = sensor_data.is_indoor(id)
+        if stored_indoor is not None:
+            indoor = stored_indoor
+
+        if typ.replace(" ", "") == "":
+            typ = sensor_data.find_sensor_type(id, year, indoor, cancel=cancel)
+            if typ is None:
+                message_box("Fehler", "Der Sensortyp konnte nicht gefunden werden. Bitte gib den Typ manuell ein.", 0)
+                self.downloading = DownloadState.NONE
+                downloader.finished()
+                return
 
-        downloader.title.configure(text=f"Suche Sensortyp...")
-        downloader.title.update()
-        indoor = sensor_data.is_indoor(id)
-        if indoor is None:
-            indoor = self.indoor_value.get()
-
-        if self.sensor_type_entry.get().replace(" ", "") != "":
-            typ = self.sensor_type_entry.get()
-        else:
-            typ = sensor_data.find_sensor_type(id, year, indoor)
-
-        self.__check_indoor(indoor)
+        gui_events.call(self.__check_indoor, indoor)
         self.downloading = DownloadState.DOWNLOADING
-        downloader.title.configure(text="Initialisiere Download...")
+        downloader.set_title("Initialisiere Download...")
 
-        self.sensor_type_entry.delete(0, "end")
-        self.sensor_type_entry.insert(0, typ)
-        self.sensor_type_entry.update()
+        gui_events.call(self.__set_sensor_type, typ)
 
-        sensor = sensor_data.load_sensor_data(year, typ, id, indoor, downloader.download)
-        if self.downloading.value.numerator == DownloadState.NONE.value.numerator:
+        dates = sensor_data.plan_sync(id, year)
+        if len(dates) == 0:
+            message_box("Download", "Die Daten sind bereits aktuell.", 0)
+            self.downloading = DownloadState.NONE
+            downloader.finished()
             return
 
+        sensor = sensor_data.load_sensor_data(year, typ, id, indoor, downloader.download, dates=dates, cancel=cancel)
+
         if sensor is None or len(sensor.sensor_data) == 0:
-            message_box("Fehler", "Es konnte keine Daten gefunden werden.", 0)
+            if sensor is not None and len(sensor.failed_dates) > 0:
+                sensor_data.mark_synced(id, year, sensor.failed_dates)
+                message_box("Fehler", f"{len(sensor.failed_dates)} Tage konnten nicht geladen werden. "
+                                      f"Bitte versuche es später erneut.", 0)
+            elif sensor_data.has_data_in_year(id, year):
+                sensor_data.mark_synced(id, year)
+                message_box("Download", "Die Daten sind bereits aktuell.", 0)
+            else:
+                message_box("Fehler", "Es konnte keine Daten gefunden werden.", 0)
             self.downloading = DownloadState.NONE
             downloader.finished()
             return
 
         self.downloading = DownloadState.SAVING_IN_DATABASE
 
-        downloader.title.configure(text="Speicher Sensor in Datenbank...")
-        sensor_data.save_in_database(sensor)
+        downloader.set_title("Speicher Sensor in Datenbank...")
+        sensor_data.save_in_database(sensor, lambda p, g, w: downloader.download(
+            p, g, w, f"Speicher Sensor in Datenbank ({int(p * 100)}%)..."), cancel=cancel)
+        sensor_data.mark_synced(id, year, sensor.failed_dates)
         downloader.finished()
 
+        gui_events.call(self.__add_to_sensor_cache, sensor.id)
+
+        if len(sensor.failed_dates) > 0:
+            message_box("Download", f"Daten wurden heruntergeladen, {len(sensor.failed_dates)} Tage konnten jedoch "
+                                    f"nicht geladen werden. Sie werden bei der nächsten Synchronisation erneut geladen.",
+                        0)
+        else:
+            message_box("Download", "Daten wurden erfolgreich heruntergeladen.", 0)
+        self.downloading = DownloadState.NONE
+
+    def __set_sensor_type(self, typ: str):
+        self.sensor_type_entry.delete(0, "end")
+        self.sensor_type_entry.insert(0, typ)
+
+    def __add_to_sensor_cache(self, id: int):
         if empty_cache in self.sensor_id_cache:
             self.sensor_id_cache.remove(empty_cache)
-        if str(sensor.id) not in self.sensor_id_cache:
-            self.sensor_id_cache.add(sensor.id)
+        if str(id) not in self.sensor_id_cache:
+            self.sensor_id_cache.add(id)
             self.__reload_option_panel()
 
-        message_box("Download", "Daten wurden erfolgreich heruntergeladen.", 0)
-        self.downloading = DownloadState.NONE
-
-    #
+    # Zeigt den Sensor im Graphen an. Der Graph wird beim ersten Aufruf erstellt und danach wiederverwendet
     def show_graph(self, sensor: sensor_data.Sensor, loader: SensorDownloader):
-        self.graph = SensorGraph(sensor, root)
+        if self.graph is None:
+            self.graph = SensorGraph(root)
         self.graph.pack(expand=True, fill="both")
-        self.graph.show_data(loader)
+        self.graph.show_sensor(sensor, loader)
 
     def __reload_option_panel(self):
         self.sensor_cache_option.destroy()
@@ -556,21 +797,22 @@ class SensorSelector(tk.Frame):
             self, self.sensor_cache_option_var, *self.sensor_id_cache, command=self.option_callback)
         self.sensor_cache_option.grid(column=1, row=4)
 
-    def __check_download(self, downloader: SensorDownloader):
-        time.sleep(sensor_search_timeout)
+    # Bricht die Suche nach dem Sensortyp ab, wenn sie länger als sensor_search_timeout dauert.
+    # Die Fehlermeldung zeigt der Download-Thread nach dem Abbruch an.
+    def __check_download(self, cancel: sensor_data.CancellationToken):
+        self.download_thread.join(timeout=sensor_search_timeout)
         if self.downloading == DownloadState.SEARCHING_TYPE:
+            self.search_timed_out = True
+            cancel.cancel()
             self.download_thread.join(timeout=sensor_thread_timeout)
-            message_box("Fehler", "Fehler beim laden des Sensortyps. Bitte gib den Typ manuell ein.", 0)
-            self.downloading = DownloadState.NONE
-            downloader.finished()
 
+    # Blendet den Graphen aus, ohne ihn zu zerstören (siehe show_graph)
     def __check_old_graph(self):
         if self.graph is not None:
-            self.graph.destroy()
+            self.graph.pack_forget()
 
     def __check_indoor(self, indoor: int):
         self.indoor_value.set(indoor)
-        self.indoor_check_btn.update()
 
     def __check_year(self, year: int) -> bool:
         if year < 2015 or year > datetime.datetime.now().year:
@@ -593,6 +835,8 @@ def already_downloading():
     message_box("Bitte warten...", "Es werden momentan Daten geladen.", 0)
 
 
+sensor_data.init()
+
 print("Opening GUI...")
 
 root = tk.Tk()
@@ -607,6 +851,8 @@ if not Path("./cache/favicon.png").exists():
         file.write(res.content)
         file.close()
 
+gui_events = GuiEvents(root)
+
 ico = Image.open("./cache/favicon.png")
 photo = ImageTk.PhotoImage(ico)
 root.wm_iconphoto(False, photo)